@@ -0,0 +1,87 @@
+"""配置读写和常量，只依赖标准库，GUI和命令行启动时都可以立即导入"""
+import json
+import os
+
+CONFIG_FILE = "config.json"
+
+# 可选的boss
+BOSS_NAMES = ("瓦尔申", "督瑞尔", "格里戈利", "冰中野兽")
+
+# 按钮的默认候选文字
+CHANGE_REWARD_LABELS = ("更改奖励",)
+OPEN_LABELS = ("打开",)
+
+# 识别流程需要的三个区域
+AREA_KEYS = ("area_change_reward", "area_boss", "area_open")
+
+
+def load_config(path=CONFIG_FILE):
+    """读取配置文件，不存在时返回空字典"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_config(config, path=CONFIG_FILE):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+
+
+def save_profile_setting(key, value, profile=None, path=CONFIG_FILE):
+    """把运行中学到的设置写回配置文件：profiles 中有同名客户端时写到该项，否则写到顶层"""
+    config = load_config(path)
+    for item in config.get("profiles") or []:
+        if item.get("name") == profile:
+            item[key] = value
+            break
+    else:
+        config[key] = value
+    save_config(config, path)
+
+
+def boss_text(config):
+    """配置中的boss：优先用 boss 名称，其次用 boss_index"""
+    if config.get("boss"):
+        return config["boss"]
+    index = config.get("boss_index") or 0
+    return BOSS_NAMES[index] if 0 <= index < len(BOSS_NAMES) else BOSS_NAMES[0]
+
+
+def region_targets(config):
+    """各区域可能出现的文字，用于生成字符白名单"""
+    labels = config.get("button_labels") or {}
+    return {
+        "area_change_reward": labels.get("change_reward_labels", CHANGE_REWARD_LABELS),
+        "area_boss": BOSS_NAMES,
+        "area_open": labels.get("open_labels", OPEN_LABELS),
+    }
+
+
+def missing_settings(config):
+    """返回缺少的必填项列表，多客户端时带上客户端名称"""
+    missing = []
+    for profile in profiles(config):
+        prefix = f"{profile['name']}." if config.get("profiles") else ""
+        missing += [prefix + key for key in AREA_KEYS + ("down_coordinate",) if not profile.get(key)]
+    return missing
+
+
+def profiles(config):
+    """返回各客户端的完整配置
+
+    config 中有 profiles 列表时，每一项是一个客户端（至少包含 name 和自己的区域、下滑坐标等），
+    未写的设置沿用顶层配置；没有 profiles 时顶层配置本身就是唯一的客户端 "default"。
+    """
+    base = {key: value for key, value in config.items() if key != "profiles"}
+    items = config.get("profiles") or [{"name": "default"}]
+    result = []
+    for i, item in enumerate(items):
+        profile = dict(base, **item)
+        profile.setdefault("name", f"profile{i + 1}")
+        # 多个客户端不能写同一个指标文件
+        if len(items) > 1 and profile.get("metrics_file") and "metrics_file" not in item:
+            root, ext = os.path.splitext(profile["metrics_file"])
+            profile["metrics_file"] = f"{root}.{profile['name']}{ext}"
+        result.append(profile)
+    return result
@@ -0,0 +1,107 @@
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from collections import deque
+
+LOGGER_NAME = "bossmanager"
+
+
+def get_logger(name=None):
+    """返回程序日志器，name为子模块名，例如 get_logger("ocr")"""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+class RingBufferHandler(logging.Handler):
+    """固定容量的环形日志缓冲，界面按序号批量取出新日志，内存不会无限增长"""
+
+    def __init__(self, capacity=500):
+        super().__init__()
+        self.capacity = capacity
+        self._entries = deque(maxlen=capacity)
+        self._seq = 0
+        self.setFormatter(logging.Formatter("[%(asctime)s] %(message)s", "%H:%M:%S"))
+
+    def emit(self, record):
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        # Handler.handle 已持有 self.lock
+        self._seq += 1
+        self._entries.append((self._seq, line))
+
+    def drain(self, since=0):
+        """返回 (最新序号, 序号大于since的日志行列表)"""
+        with self.lock:
+            lines = [line for seq, line in self._entries if seq > since]
+            return self._seq, lines
+
+
+class JsonlFormatter(logging.Formatter):
+    """一条日志一行JSON，extra 中的 fields 字典会合并进去"""
+
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+_setup_lock = threading.Lock()
+_ring = None
+_listener = None
+
+
+def setup_logging(level="INFO", log_file=None, max_bytes=5 * 1024 * 1024, backups=3,
+                  verbose_ocr=False, console=True, ring_capacity=500):
+    """初始化日志，返回供界面读取的环形缓冲
+
+    log_file 不为空时在后台线程写入按大小轮转的JSONL文件；verbose_ocr 打开OCR原始输出等调试日志。
+    重复调用会替换之前的设置。
+    """
+    global _ring, _listener
+    with _setup_lock:
+        logger = get_logger()
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        logger.setLevel(level)
+        logger.propagate = False
+        get_logger("ocr").setLevel(logging.DEBUG if verbose_ocr else logging.INFO)
+
+        _ring = RingBufferHandler(ring_capacity)
+        logger.addHandler(_ring)
+        if console:
+            stream = logging.StreamHandler()
+            stream.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s %(message)s", "%H:%M:%S"))
+            logger.addHandler(stream)
+        if log_file:
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+            file_handler.setFormatter(JsonlFormatter())
+            records = queue.Queue(-1)
+            logger.addHandler(logging.handlers.QueueHandler(records))
+            _listener = logging.handlers.QueueListener(records, file_handler)
+            _listener.start()
+        return _ring
+
+
+def shutdown_logging():
+    """停止后台写文件线程，确保日志落盘"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
@@ -0,0 +1,305 @@
+"""离线基准测试：回放标注好的区域截图，统计各阶段耗时和每个目标的识别准确率
+
+语料目录下放 labels.json，每项描述一张区域截图::
+
+    [{"image": "boss/page1.png", "region": "area_boss", "state": "select_boss",
+      "targets": ["瓦尔申", "督瑞尔"]}]
+
+targets 为截图中实际出现的文字。用法::
+
+    python benchmark.py corpus --repeat 3 --output bench.json --baseline last.json
+    python benchmark.py corpus --compare-engines tesserocr,onnx   # 同一批截图上对比两个引擎
+    python benchmark.py --memory 10000                            # 用模拟器跑一万轮，检查内存是否持续上涨
+                                                                  # （直接取模拟器画面、经屏幕截图缓冲区各跑一次）
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from frame_source import SyntheticFrameSource
+from metrics import StageTimer, rss_bytes
+from ocr_engine import create_engine
+from text_recognition import TextRecognizer
+from app_config import BOSS_NAMES, CHANGE_REWARD_LABELS, OPEN_LABELS
+
+REGION_TARGETS = {
+    'area_change_reward': CHANGE_REWARD_LABELS,
+    'area_boss': BOSS_NAMES,
+    'area_open': OPEN_LABELS,
+}
+
+
+def load_corpus(corpus_dir):
+    """读取 labels.json 和对应的截图（RGB）"""
+    with open(os.path.join(corpus_dir, 'labels.json'), 'r', encoding='utf-8') as f:
+        labels = json.load(f)
+    samples = []
+    for item in labels:
+        path = os.path.join(corpus_dir, item['image'])
+        bgr = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if bgr is None:
+            print(f"无法读取截图: {path}")
+            continue
+        samples.append(dict(item, frame=cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)))
+    return samples
+
+
+def region_targets(samples):
+    """每个区域要查找的目标：已知文字加上标注中出现过的文字"""
+    targets = {name: list(values) for name, values in REGION_TARGETS.items()}
+    for sample in samples:
+        known = targets.setdefault(sample['region'], [])
+        for target in sample['targets']:
+            if target not in known:
+                known.append(target)
+    return targets
+
+
+def run_benchmark(samples, engine=None, repeat=1, region_settings=None, use_cache=False):
+    """逐张回放截图，返回可写成JSON的结果"""
+    targets = region_targets(samples)
+    recognizer = TextRecognizer(engine=engine)
+    recognizer.configure_regions(region_settings, targets)
+    recognizer.timings = StageTimer(maxlen=None)
+    # 每个区域一次查找（预处理 + OCR + 匹配）的总耗时
+    region_timings = StageTimer(maxlen=None)
+    counts = {}
+    states = {}
+    regions = {}
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for sample in samples:
+            frame = sample['frame']
+            height, width = frame.shape[:2]
+            recognizer.set_frame_source(SyntheticFrameSource(width, height, renderer=lambda i, f=frame: f))
+            if not use_cache:
+                recognizer.reset()
+            candidates = targets[sample['region']]
+            with region_timings.span(sample['region']):
+                results = recognizer.find_many(candidates, (0, 0, width, height), sample['region'])
+            expected = set(sample['targets'])
+            state = states.setdefault(sample.get('state', sample['region']), {'samples': 0, 'correct': 0})
+            state['samples'] += 1
+            region = regions.setdefault(sample['region'], {'samples': 0, 'correct': 0})
+            region['samples'] += 1
+            correct = True
+            for target in candidates:
+                found = bool(results[target])
+                c = counts.setdefault(target, {'tp': 0, 'fp': 0, 'fn': 0})
+                if found and target in expected:
+                    c['tp'] += 1
+                elif found:
+                    c['fp'] += 1
+                    correct = False
+                elif target in expected:
+                    c['fn'] += 1
+                    correct = False
+            state['correct'] += correct
+            region['correct'] += correct
+    elapsed = time.perf_counter() - start
+
+    accuracy = {}
+    for target, c in counts.items():
+        detected = c['tp'] + c['fp']
+        present = c['tp'] + c['fn']
+        accuracy[target] = dict(
+            c,
+            precision=c['tp'] / detected if detected else 1.0,
+            recall=c['tp'] / present if present else 1.0,
+        )
+    return {
+        'engine': getattr(recognizer.engine, 'name', type(recognizer.engine).__name__),
+        'samples': len(samples),
+        'repeat': repeat,
+        'elapsed_s': elapsed,
+        'latency': recognizer.timings.summary(),
+        'targets': accuracy,
+        'states': states,
+        'regions': {name: dict(stats, accuracy=stats['correct'] / stats['samples'],
+                               latency=region_timings.summary()[name])
+                    for name, stats in regions.items()},
+    }
+
+
+def compare(result, baseline, tolerance=0.1, accuracy_drop=0.02):
+    """和基线结果比较，返回回退说明列表"""
+    regressions = []
+    for stage, stats in result['latency'].items():
+        old = baseline.get('latency', {}).get(stage)
+        if not old:
+            continue
+        for key in ('p50_ms', 'p90_ms'):
+            if old[key] > 0 and stats[key] > old[key] * (1 + tolerance):
+                regressions.append(f"{stage} {key}: {old[key]:.1f} -> {stats[key]:.1f}")
+    for target, stats in result['targets'].items():
+        old = baseline.get('targets', {}).get(target)
+        if not old:
+            continue
+        for key in ('precision', 'recall'):
+            if stats[key] < old[key] - accuracy_drop:
+                regressions.append(f"{target} {key}: {old[key]:.2f} -> {stats[key]:.2f}")
+    return regressions
+
+
+def print_report(result):
+    print(f"引擎: {result['engine']}，样本 {result['samples']} 张 × {result['repeat']} 次，"
+          f"总耗时 {result['elapsed_s']:.2f} 秒")
+    for stage, stats in result['latency'].items():
+        print(f"  {stage:<10} n={stats['count']:<5} p50={stats['p50_ms']:.1f}ms "
+              f"p90={stats['p90_ms']:.1f}ms p99={stats['p99_ms']:.1f}ms")
+    for target, stats in result['targets'].items():
+        print(f"  {target}: 精确率 {stats['precision']:.2f} 召回率 {stats['recall']:.2f} "
+              f"(TP {stats['tp']} FP {stats['fp']} FN {stats['fn']})")
+
+
+def compare_engines(results, accuracy_drop=0.02):
+    """对比多个引擎在各区域上的耗时和准确率，返回 {区域: 推荐的引擎}
+
+    推荐准确率不比最好的引擎低 accuracy_drop 以上的引擎中最快的一个。
+    """
+    print("各区域对比（p50耗时 / 准确率）:")
+    suggestions = {}
+    for region in sorted({name for result in results for name in result['regions']}):
+        rows = [(result['engine'], result['regions'][region]) for result in results if region in result['regions']]
+        best_accuracy = max(stats['accuracy'] for _, stats in rows)
+        eligible = [(stats['latency']['p50_ms'], engine) for engine, stats in rows
+                    if stats['accuracy'] >= best_accuracy - accuracy_drop]
+        suggestions[region] = min(eligible)[1]
+        cells = '  '.join(f"{engine}: {stats['latency']['p50_ms']:.1f}ms / {stats['accuracy']:.0%}" for engine, stats in rows)
+        print(f"  {region:<20} {cells}  -> {suggestions[region]}")
+    return suggestions
+
+
+def memory_benchmark(cycles=10000, boss=None, interval=0.1, warmup=0.1, screen_buffers=False):
+    """用模拟器连续跑 cycles 轮，期间定时采样进程常驻内存
+
+    关闭识别缓存，每次查找都走 OCR、结果解析和按行合并，这些路径上的泄漏才能暴露出来。
+    screen_buffers 为True时经 ScreenFrameSource 的缓冲区复用路径截图，覆盖实时截图的内存占用。
+    前 warmup 比例的采样视为预热（缓冲区建立），之后到结束的增量即为内存增长。
+    """
+    from simulator import run_simulation
+
+    if rss_bytes() is None:
+        raise RuntimeError("无法获取进程内存，请安装 psutil")
+    samples = []
+    done = threading.Event()
+    started = time.perf_counter()
+
+    def sample():
+        while not done.wait(interval):
+            samples.append((time.perf_counter() - started, rss_bytes()))
+
+    thread = threading.Thread(target=sample, daemon=True)
+    thread.start()
+    try:
+        result = run_simulation(cycles, boss, use_cache=False, screen_buffers=screen_buffers)
+    finally:
+        done.set()
+        thread.join()
+    samples.append((time.perf_counter() - started, rss_bytes()))
+    base = samples[int((len(samples) - 1) * warmup)][1]
+    end = samples[-1][1]
+    mb = 1024 * 1024
+    return {
+        'frame_source': 'screen' if screen_buffers else 'simulator',
+        'cycles': result['cycles'],
+        'ocr_calls': result['ocr_calls'],
+        'elapsed_s': samples[-1][0],
+        'rss_start_mb': base / mb,
+        'rss_end_mb': end / mb,
+        'rss_peak_mb': max(rss for _, rss in samples) / mb,
+        'growth_mb': (end - base) / mb,
+        'samples': [(round(t, 2), round(rss / mb, 2)) for t, rss in samples],
+    }
+
+
+def print_memory_report(result):
+    source = "屏幕截图缓冲区" if result['frame_source'] == 'screen' else "模拟器画面"
+    print(f"[{source}] 完成 {result['cycles']} 轮，OCR {result['ocr_calls']} 次，耗时 {result['elapsed_s']:.1f}s")
+    print(f"  常驻内存: 预热后 {result['rss_start_mb']:.1f}MB → 结束 {result['rss_end_mb']:.1f}MB，"
+          f"峰值 {result['rss_peak_mb']:.1f}MB，增长 {result['growth_mb']:+.1f}MB")
+    samples = result['samples']
+    # 均匀挑10个采样点，看曲线是否平坦
+    step = max(1, len(samples) // 10)
+    print("  " + "  ".join(f"{t:.0f}s:{rss:.1f}" for t, rss in samples[::step]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="离线OCR基准测试")
+    parser.add_argument('corpus', nargs='?', help="包含 labels.json 的截图目录")
+    parser.add_argument('--repeat', type=int, default=1, help="每张截图重复次数")
+    parser.add_argument('--engine', default='auto', help="OCR引擎: auto / tesserocr / pytesseract")
+    parser.add_argument('--config', default='config.json', help="读取其中的 region_settings")
+    parser.add_argument('--use-cache', action='store_true', help="保留模板和画面缓存（默认每张截图前清空）")
+    parser.add_argument('--output', help="结果写入的JSON文件")
+    parser.add_argument('--baseline', help="作为对比的上一次结果JSON")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="耗时允许上涨的比例")
+    parser.add_argument('--compare-engines', help="逗号分隔的多个引擎，在同一批截图上对比，例如 tesserocr,onnx")
+    parser.add_argument('--memory', type=int, metavar='CYCLES', help="用模拟器跑指定轮数，采样常驻内存")
+    parser.add_argument('--max-growth', type=float, default=10.0, help="--memory 时允许的内存增长(MB)")
+    args = parser.parse_args(argv)
+
+    if args.memory:
+        results = []
+        for screen_buffers in (False, True):
+            result = memory_benchmark(args.memory, screen_buffers=screen_buffers)
+            print_memory_report(result)
+            results.append(result)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+        return 0 if all(r['growth_mb'] <= args.max_growth for r in results) else 1
+    if not args.corpus:
+        parser.error("需要语料目录，或使用 --memory")
+
+    region_settings = None
+    if args.config and os.path.exists(args.config):
+        with open(args.config, 'r', encoding='utf-8') as f:
+            region_settings = json.load(f).get('region_settings')
+
+    samples = load_corpus(args.corpus)
+    if args.compare_engines:
+        # 对比时所有区域都用被测引擎，忽略 region_settings 中的 engine
+        settings = {name: {k: v for k, v in spec.items() if k != 'engine'}
+                    for name, spec in (region_settings or {}).items()}
+        results = []
+        for name in args.compare_engines.split(','):
+            engine = create_engine(name.strip())
+            if engine.name != name.strip():
+                print(f"引擎 {name} 不可用，跳过")
+                continue
+            result = run_benchmark(samples, engine, args.repeat, settings, args.use_cache)
+            print_report(result)
+            results.append(result)
+        if len(results) < 2:
+            print("可用的引擎少于两个，无法对比")
+            return 1
+        suggestions = compare_engines(results)
+        print("可在 region_settings 中为各区域设置 engine:", json.dumps(suggestions, ensure_ascii=False))
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({'engines': results, 'suggestions': suggestions}, f, ensure_ascii=False, indent=2)
+        return 0
+    result = run_benchmark(samples, create_engine(args.engine), args.repeat, region_settings, args.use_cache)
+    print_report(result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"回退: {line}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+class BossLayout:
+    """boss列表布局：每个boss在第几次下滑后出现、在boss区域内的位置
+
+    正常查找时顺带记录当前页看到的所有boss，之后每轮可以直接下滑到目标所在页，
+    只OCR目标所在的一行来确认。布局与 area_boss 和下滑坐标绑定，二者变化后旧记录作废。
+    保存到配置中的格式::
+
+        {"area": [x, y, w, h], "down": [x, y], "rows": {"瓦尔申": [下滑次数, 区域内x, 区域内y]}}
+    """
+
+    def __init__(self, area, down, data=None, strip_margin=24):
+        self.area = tuple(area) if area else None
+        self.down = tuple(down) if down else None
+        self.strip_margin = strip_margin  # 目标行上下各取的像素
+        self.rows = {}
+        self.changed = False
+        if data and self._same_setup(data):
+            self.rows = {name: tuple(row) for name, row in (data.get("rows") or {}).items()}
+
+    def _same_setup(self, data):
+        return (tuple(data.get("area") or ()) == (self.area or ())
+                and tuple(data.get("down") or ()) == (self.down or ()))
+
+    def get(self, name):
+        """返回 (下滑次数, 区域内x, 区域内y)，没有记录时返回None"""
+        return self.rows.get(name)
+
+    def record(self, name, scrolls, x, y, tolerance=10):
+        """记录在下滑 scrolls 次后于屏幕坐标 (x, y) 看到的boss，只保留最早出现的一页"""
+        if not self.area:
+            return
+        rel_x, rel_y = x - self.area[0], y - self.area[1]
+        old = self.rows.get(name)
+        if old is not None and (old[0] < scrolls or (
+                old[0] == scrolls and abs(old[1] - rel_x) <= tolerance and abs(old[2] - rel_y) <= tolerance)):
+            return
+        self.rows[name] = (scrolls, rel_x, rel_y)
+        self.changed = True
+
+    def probe(self, scrolls):
+        """第 scrolls 页上任意一个已记录的boss，用来确认该页已经显示"""
+        names = [name for name, row in self.rows.items() if row[0] == scrolls]
+        return min(names, key=lambda name: self.rows[name][2]) if names else None
+
+    def strip(self, name):
+        """目标所在的一行：与boss区域同宽，高为上下各 strip_margin 像素"""
+        x, y, w, h = self.area
+        center = y + self.rows[name][2]
+        top = max(y, center - self.strip_margin)
+        bottom = min(y + h, center + self.strip_margin)
+        return x, top, w, bottom - top
+
+    def clear(self):
+        if self.rows:
+            self.rows = {}
+            self.changed = True
+
+    def to_config(self):
+        return {
+            "area": list(self.area) if self.area else None,
+            "down": list(self.down) if self.down else None,
+            "rows": {name: list(row) for name, row in self.rows.items()},
+        }
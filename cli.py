@@ -0,0 +1,105 @@
+"""无界面运行入口：读取 config.json，执行与GUI相同的 更改奖励 → boss → 打开 流程
+
+    python cli.py                     # 按 config.json 运行，Ctrl+C 停止
+    python cli.py --boss 督瑞尔 --cycles 10
+    python cli.py --calibrate         # 先整屏校准文字位置再运行
+    python cli.py --check             # 只检查配置
+    python cli.py --startup-time      # 输出启动耗时后退出
+"""
+import time
+# 启动计时起点，尽量放在最前面
+_STARTUP_T0 = time.perf_counter()
+import argparse
+import signal
+import sys
+
+from app_config import BOSS_NAMES, load_config, missing_settings
+from app_log import get_logger, setup_logging, shutdown_logging
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="无界面自动识别点击")
+    parser.add_argument("--config", default="config.json", help="配置文件路径")
+    parser.add_argument("--boss", help=f"boss名称，可选: {'/'.join(BOSS_NAMES)}")
+    parser.add_argument("--interval", type=float, help="每轮之间的间隔(秒)")
+    parser.add_argument("--cycles", type=int, help="每个客户端完成指定轮数后退出")
+    parser.add_argument("--profile", action="append", help="只运行指定名称的客户端，可重复")
+    parser.add_argument("--log-file", help="JSONL日志文件")
+    parser.add_argument("--verbose-ocr", action="store_true", help="记录OCR原始输出")
+    parser.add_argument("--calibrate", action="store_true", help="开始前整屏OCR一次，为目标建立跟踪小框")
+    parser.add_argument("--check", action="store_true", help="只检查配置，不运行")
+    parser.add_argument("--startup-time", action="store_true", help="输出启动耗时后退出")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = load_config(args.config)
+    if args.boss:
+        config["boss"] = args.boss
+    if args.interval:
+        config["interval"] = args.interval
+    log_settings = config.get("log") or {}
+    setup_logging(
+        level=log_settings.get("level", "INFO"),
+        log_file=args.log_file or log_settings.get("file"),
+        verbose_ocr=args.verbose_ocr or log_settings.get("verbose_ocr", False),
+    )
+    log = get_logger()
+
+    missing = missing_settings(config)
+    if missing:
+        log.error(f"配置缺少: {', '.join(missing)}")
+        return 2
+    if args.check:
+        log.info("配置检查通过")
+        return 0
+    cli_ms = (time.perf_counter() - _STARTUP_T0) * 1000
+
+    started = time.perf_counter()
+    from workflow import build_workflows, create_pool, save_boss_layouts
+    from scheduler import ProfileScheduler
+    pool = create_pool(config)
+    workflows = build_workflows(config, pool, names=args.profile, max_cycles=args.cycles)
+    if not workflows:
+        log.error(f"没有找到客户端: {', '.join(args.profile)}")
+        return 2
+    scheduler = ProfileScheduler(workflows)
+    ready_ms = (time.perf_counter() - _STARTUP_T0) * 1000
+    log.info(f"识别模块加载耗时 {(time.perf_counter() - started) * 1000:.0f}ms，总启动耗时 {ready_ms:.0f}ms")
+    if args.startup_time:
+        # cli_ms 为读取配置前的开销，ready_ms 为识别模块就绪的总耗时
+        print(f"cli_ms={cli_ms:.1f} ready_ms={ready_ms:.1f}")
+        for workflow in workflows:
+            workflow.close()
+        if pool:
+            pool.shutdown()
+        shutdown_logging()
+        return 0
+
+    # Ctrl+C 立即打断等待
+    signal.signal(signal.SIGINT, lambda *_: scheduler.stop())
+
+    if args.calibrate:
+        for workflow in workflows:
+            workflow.calibrate()
+
+    for workflow in workflows:
+        workflow.log(f"开始识别流程，boss: {workflow.boss_text}，间隔: {workflow.interval}秒")
+    try:
+        scheduler.run()
+        # 本次运行记录或重建的boss列表布局，下次启动直接使用
+        if save_boss_layouts(workflows, args.config):
+            log.info("boss列表布局已写入配置")
+    finally:
+        if pool:
+            pool.shutdown()
+        shutdown_logging()
+    # 被用户停止或达到轮数时正常退出，有流程中途失败返回1
+    return 0 if all(workflow.stop_event.is_set() for workflow in workflows) else 1
+
+
+if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,44 @@
+import threading
+import time
+
+
+class RealClock:
+    """真实时间，等待可以被 stop_event 打断"""
+    virtual = False
+
+    def now(self):
+        return time.monotonic()
+
+    def wait(self, event, timeout):
+        """等待 timeout 秒或 event 被设置，返回 event 是否已设置"""
+        return event.wait(timeout)
+
+
+class VirtualClock:
+    """虚拟时间：wait 不真正等待，而是把时间直接拨到等待结束的时刻
+
+    与模拟器配合可以在几分钟内跑完成千上万轮流程。
+    """
+    virtual = True
+
+    def __init__(self, start=0.0):
+        self._now = start
+        self._lock = threading.Lock()
+
+    def now(self):
+        return self._now
+
+    def advance(self, seconds):
+        with self._lock:
+            self._now += max(0.0, seconds)
+            return self._now
+
+    def wait(self, event, timeout):
+        if event.is_set():
+            return True
+        self.advance(timeout)
+        return event.is_set()
+
+
+# 默认时钟
+real_clock = RealClock()
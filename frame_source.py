@@ -0,0 +1,375 @@
+import os
+import threading
+import time
+import warnings
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+try:
+    import mss
+except ImportError:
+    mss = None
+
+
+class FrameSource:
+    """画面来源接口
+
+    grab(roi) 返回 RGB 格式的 NumPy 数组，roi 为 (x, y, width, height) 屏幕坐标，
+    为 None 时返回整个画面。返回的数组可能在下一次 grab 时被复用，需要长期保存时请自行 copy。
+    """
+
+    def grab(self, roi=None):
+        raise NotImplementedError
+
+    def grab_into(self, roi, out):
+        """把 roi 的画面写入预先分配好的 out（形状为 (h, w, 3)），默认实现会多拷贝一次"""
+        np.copyto(out, self.grab(roi))
+        return out
+
+    def screen_size(self):
+        """返回画面尺寸 (width, height)"""
+        raise NotImplementedError
+
+    def invalidate(self):
+        """画面即将变化（例如刚点击过）时调用，之后的 grab 不会再返回调用前截取的画面"""
+
+    def close(self):
+        pass
+
+
+def _clip_roi(roi, width, height):
+    """把识别区域裁剪到画面范围内"""
+    x, y, w, h = roi
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(width, x + w), min(height, y + h)
+    if x1 <= x0 or y1 <= y0:
+        raise ValueError(f"识别区域非法: {roi}")
+    return x0, y0, x1, y1
+
+
+class ScreenFrameSource(FrameSource):
+    """实时屏幕截图，优先使用mss直接写入复用的缓冲区，未安装时退回PIL.ImageGrab"""
+
+    def __init__(self, max_buffers=16):
+        # mss实例不能跨线程使用
+        self._local = threading.local()
+        # 识别区域随位置跟踪不断变化尺寸，只保留最近用过的几个缓冲区
+        self._buffers = OrderedDict()
+        self.max_buffers = max_buffers
+
+    def _sct(self):
+        sct = getattr(self._local, 'sct', None)
+        if sct is None:
+            sct = self._local.sct = mss.mss()
+        return sct
+
+    def _buffer(self, height, width):
+        key = (threading.get_ident(), height, width)
+        buf = self._buffers.get(key)
+        if buf is None:
+            buf = self._buffers[key] = np.empty((height, width, 3), dtype=np.uint8)
+            while len(self._buffers) > self.max_buffers:
+                self._buffers.popitem(last=False)
+        else:
+            self._buffers.move_to_end(key)
+        return buf
+
+    def screen_size(self):
+        if mss is not None:
+            monitor = self._sct().monitors[0]
+            return monitor['width'], monitor['height']
+        import pyautogui
+        return tuple(pyautogui.size())
+
+    def grab(self, roi=None):
+        if roi is None:
+            roi = (0, 0) + tuple(self.screen_size())
+        x, y, w, h = roi
+        if w <= 0 or h <= 0:
+            raise ValueError(f"识别区域宽高非法: {roi}")
+        return self.grab_into(roi, self._buffer(h, w))
+
+    def grab_into(self, roi, out):
+        x, y, w, h = roi
+        if mss is not None:
+            shot = self._sct().grab({'left': x, 'top': y, 'width': w, 'height': h})
+            bgra = np.frombuffer(shot.raw, dtype=np.uint8).reshape(h, w, 4)
+            cv2.cvtColor(bgra, cv2.COLOR_BGRA2RGB, dst=out)
+        else:
+            from PIL import ImageGrab
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                screenshot = ImageGrab.grab(bbox=(x, y, x + w, y + h))
+            np.copyto(out, np.asarray(screenshot.convert('RGB')))
+        return out
+
+
+def _bounding_box(rois):
+    x0 = min(r[0] for r in rois)
+    y0 = min(r[1] for r in rois)
+    x1 = max(r[0] + r[2] for r in rois)
+    y1 = max(r[1] + r[3] for r in rois)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def _covers(box, roi):
+    return (box[0] <= roi[0] and box[1] <= roi[1]
+            and roi[0] + roi[2] <= box[0] + box[2] and roi[1] + roi[3] <= box[1] + box[3])
+
+
+class BufferedFrameSource(FrameSource):
+    """后台截图线程 + 预分配的环形缓冲，grab 直接返回最新一帧的视图
+
+    截图线程持续截取最近 grab 过的区域的外接矩形，写入 slots 个预先分配的缓冲之一；
+    grab 取最新一帧中对应区域的切片，不做拷贝。每个调用线程当前持有的那一帧会被钉住，
+    直到该线程下一次 grab 前都不会被覆盖（与 FrameSource 的约定一致）。
+    最新一帧太旧、早于 invalidate() 或不包含所请求区域时，最多等待 wait_timeout 秒，
+    仍没有合适的帧就直接从底层画面来源截图。
+    一段时间没有 grab 时截图线程暂停，不占用CPU。底层来源需支持跨线程调用（如实时屏幕）。
+    """
+
+    def __init__(self, source, slots=3, interval=0.02, max_age=0.1, wait_timeout=0.1,
+                 idle_timeout=1.0, region_ttl=5.0):
+        self.source = source
+        self.interval = interval          # 两次截图的最小间隔（秒）
+        self.max_age = max_age            # 帧的最大可用时长（秒）
+        self.wait_timeout = wait_timeout
+        self.idle_timeout = idle_timeout  # 超过该时长没有 grab 时暂停截图
+        self.region_ttl = region_ttl      # 区域超过该时长没有 grab 时不再截取
+        self._slots = [{'buf': None, 'box': None, 'time': 0.0} for _ in range(max(slots, 2))]
+        self._latest = None
+        self._pinned = {}
+        self._regions = {}
+        self._last_request = 0.0
+        self._not_before = 0.0
+        self._stopped = False
+        self._cond = threading.Condition()
+        self.hits = 0
+        self.misses = 0
+        self._thread = threading.Thread(target=self._run, name="frame-capture", daemon=True)
+        self._thread.start()
+
+    def _next_job(self):
+        """等到有区域需要截图，返回 (缓冲下标, 截图范围)；停止时返回None"""
+        with self._cond:
+            while True:
+                if self._stopped:
+                    return None
+                now = time.monotonic()
+                for roi, last in list(self._regions.items()):
+                    if now - last > self.region_ttl:
+                        del self._regions[roi]
+                if self._regions and now - self._last_request <= self.idle_timeout:
+                    busy = set(self._pinned.values())
+                    busy.add(self._latest)
+                    free = [i for i in range(len(self._slots)) if i not in busy]
+                    if free:
+                        return free[0], _bounding_box(list(self._regions))
+                    # 缓冲都被占用，稍后再试
+                    self._cond.wait(self.interval)
+                else:
+                    self._cond.wait()
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            index, box = job
+            slot = self._slots[index]
+            x, y, w, h = box
+            if slot['buf'] is None or slot['buf'].shape[:2] != (h, w):
+                slot['buf'] = np.empty((h, w, 3), dtype=np.uint8)
+            started = time.monotonic()
+            try:
+                self.source.grab_into(box, slot['buf'])
+            except Exception:
+                # 截图失败（例如区域超出屏幕）时由 grab 直接截图
+                with self._cond:
+                    self._cond.wait(self.interval)
+                continue
+            with self._cond:
+                slot['box'] = box
+                slot['time'] = started
+                self._latest = index
+                self._cond.notify_all()
+            delay = self.interval - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+    def _usable(self, roi, now):
+        if self._latest is None:
+            return None
+        slot = self._slots[self._latest]
+        if (slot['time'] < self._not_before or now - slot['time'] > self.max_age
+                or not _covers(slot['box'], roi)):
+            return None
+        return slot
+
+    def grab(self, roi=None):
+        if roi is None:
+            return self.source.grab(None)
+        roi = tuple(roi)
+        me = threading.get_ident()
+        with self._cond:
+            now = time.monotonic()
+            # 登记区域并唤醒截图线程，释放本线程上一次 grab 钉住的帧
+            self._regions[roi] = now
+            self._last_request = now
+            self._pinned.pop(me, None)
+            self._cond.notify_all()
+            deadline = now + self.wait_timeout
+            slot = self._usable(roi, now)
+            while slot is None and now < deadline:
+                self._cond.wait(deadline - now)
+                now = time.monotonic()
+                slot = self._usable(roi, now)
+            if slot is not None:
+                self._pinned[me] = self._latest
+                self.hits += 1
+                x, y, w, h = roi
+                bx, by = slot['box'][:2]
+                return slot['buf'][y - by:y - by + h, x - bx:x - bx + w]
+            self.misses += 1
+        return self.source.grab(roi)
+
+    def screen_size(self):
+        return self.source.screen_size()
+
+    def invalidate(self):
+        with self._cond:
+            self._not_before = time.monotonic()
+
+    def close(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join(timeout=1)
+        self.source.close()
+
+
+class ReplayFrameSource(FrameSource):
+    """回放录制的截图目录或视频文件，可在无显示器的环境下运行
+
+    每次 grab 默认前进一帧；advance_on_grab=False 时需手动调用 advance()。
+    origin 为录制画面左上角对应的屏幕坐标。
+    """
+    IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+    def __init__(self, path, loop=True, advance_on_grab=True, origin=(0, 0)):
+        self.path = path
+        self.loop = loop
+        self.advance_on_grab = advance_on_grab
+        self.origin = origin
+        self._frame = None
+        self._index = -1
+        self._capture = None
+        self._files = []
+        if os.path.isdir(path):
+            self._files = sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.lower().endswith(self.IMAGE_EXTS)
+            )
+            if not self._files:
+                raise ValueError(f"目录中没有截图: {path}")
+        else:
+            self._capture = cv2.VideoCapture(path)
+            if not self._capture.isOpened():
+                raise ValueError(f"无法打开视频: {path}")
+        self.advance()
+
+    def _read(self, index):
+        if self._capture is not None:
+            ok, bgr = self._capture.read()
+            if not ok:
+                if not self.loop:
+                    return None
+                self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ok, bgr = self._capture.read()
+                if not ok:
+                    return None
+        else:
+            if index >= len(self._files):
+                if not self.loop:
+                    return None
+                index %= len(self._files)
+            # cv2.imread 不支持中文路径
+            bgr = cv2.imdecode(np.fromfile(self._files[index], dtype=np.uint8), cv2.IMREAD_COLOR)
+        return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+    def advance(self):
+        """切换到下一帧，没有更多帧时返回False"""
+        frame = self._read(self._index + 1)
+        if frame is None:
+            return False
+        self._index += 1
+        self._frame = frame
+        return True
+
+    def screen_size(self):
+        h, w = self._frame.shape[:2]
+        return w, h
+
+    def grab(self, roi=None):
+        frame = self._frame
+        if self.advance_on_grab:
+            self.advance()
+        if roi is None:
+            return frame
+        x, y, w, h = roi
+        ox, oy = self.origin
+        x0, y0, x1, y1 = _clip_roi((x - ox, y - oy, w, h), frame.shape[1], frame.shape[0])
+        return frame[y0:y1, x0:x1]
+
+    def close(self):
+        if self._capture is not None:
+            self._capture.release()
+
+
+class SyntheticFrameSource(FrameSource):
+    """合成画面，renderer(index) 返回整屏RGB数组；不传时生成纯色画面"""
+
+    def __init__(self, width=1920, height=1080, renderer=None, color=(32, 32, 32)):
+        self.width = width
+        self.height = height
+        self.renderer = renderer
+        self._index = 0
+        self._canvas = np.empty((height, width, 3), dtype=np.uint8)
+        self._canvas[:] = color
+
+    def screen_size(self):
+        return self.width, self.height
+
+    def grab(self, roi=None):
+        frame = self.renderer(self._index) if self.renderer else self._canvas
+        self._index += 1
+        if roi is None:
+            return frame
+        x0, y0, x1, y1 = _clip_roi(roi, frame.shape[1], frame.shape[0])
+        return frame[y0:y1, x0:x1]
+
+
+def create_frame_source(spec=None):
+    """根据配置创建画面来源，例如 {"type": "replay", "path": "recordings"}
+
+    {"type": "screen", "buffered": true} 使用后台截图线程，buffered 也可以是
+    BufferedFrameSource 的参数字典，例如 {"interval": 0.05}。
+    """
+    spec = dict(spec or {})
+    kind = spec.pop('type', 'screen')
+    if kind == 'screen':
+        buffered = spec.pop('buffered', False)
+        if buffered:
+            return BufferedFrameSource(ScreenFrameSource(), **(buffered if isinstance(buffered, dict) else {}))
+        return ScreenFrameSource()
+    if kind == 'replay':
+        if 'origin' in spec:
+            spec['origin'] = tuple(spec['origin'])
+        return ReplayFrameSource(**spec)
+    if kind == 'synthetic':
+        if 'color' in spec:
+            spec['color'] = tuple(spec['color'])
+        return SyntheticFrameSource(**spec)
+    raise ValueError(f"未知的画面来源类型: {kind}")
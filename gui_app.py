@@ -1,78 +1,33 @@
-import sys
 import time
+# 启动计时起点，尽量放在最前面
+_STARTUP_T0 = time.perf_counter()
+import sys
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                            QPushButton, QLabel, QTextEdit, QComboBox,
+                            QPushButton, QLabel, QPlainTextEdit, QComboBox,
                             QSpinBox, QGroupBox, QMessageBox, QRubberBand)
-from PyQt5.QtCore import QThread, pyqtSignal, Qt, QRect, QPoint
+from PyQt5.QtCore import QThread, QTimer, pyqtSignal, Qt, QRect, QPoint
 from PyQt5.QtGui import QPainter, QColor, QPen
-from text_recognition import click_on_text, set_recognition_area
-import pyautogui
-from pynput import mouse
-import json
-import os
-from PIL import Image
-import warnings
-import numpy as np
+# 识别相关的重型模块（cv2、OCR引擎等）在开始识别时才导入
+from app_log import get_logger, setup_logging, shutdown_logging
+from app_config import BOSS_NAMES, load_config, save_config
+import multiprocessing
 
 class RecognitionThread(QThread):
-    update_signal = pyqtSignal(str)
     finished_signal = pyqtSignal()
 
-    def __init__(self, boss_text, interval, down_coordinate, area_change_reward, area_boss, area_open):
+    def __init__(self, config, pool=None):
         super().__init__()
-        self.boss_text = boss_text
-        self.interval = interval
-        self.down_coordinate = down_coordinate
-        self.area_change_reward = area_change_reward
-        self.area_boss = area_boss
-        self.area_open = area_open
-        self.running = True
+        from workflow import build_workflows
+        from scheduler import ProfileScheduler
+        self.workflows = build_workflows(config, pool)
+        self.scheduler = ProfileScheduler(self.workflows)
 
     def run(self):
-        while self.running:
-            # 1. 识别"更改奖励"
-            found, msg = click_on_text("更改奖励", self.area_change_reward)
-            self.update_signal.emit(msg)
-            if not found:
-                time.sleep(self.interval)
-                continue
-
-            # 2. 点击后等待0.5秒，识别boss
-            time.sleep(0.5)
-            retry = 0
-            boss_found = False
-            while retry < 3 and self.running:
-                found, msg = click_on_text(self.boss_text, self.area_boss)
-                self.update_signal.emit(msg)
-                if found:
-                    boss_found = True
-                    break
-                else:
-                    if self.down_coordinate:
-                        pyautogui.click(self.down_coordinate[0], self.down_coordinate[1])
-                        self.update_signal.emit("未识别到boss，点击下滑重试")
-                    else:
-                        self.update_signal.emit("未设置下滑坐标，无法下滑")
-                        break
-                    time.sleep(0.5)
-                    retry += 1
-            if not boss_found:
-                self.update_signal.emit("多次未识别到boss，停止识别")
-                break
-
-            # 3. 等待1秒，识别"打开"
-            time.sleep(1)
-            found, msg = click_on_text("打开", self.area_open)
-            self.update_signal.emit(msg)
-            if not found:
-                self.update_signal.emit("未识别到'打开'，停止识别")
-                break
-
-            time.sleep(self.interval)
+        self.scheduler.run()
         self.finished_signal.emit()
 
     def stop(self):
-        self.running = False
+        self.scheduler.stop()
 
 class SelectionOverlay(QWidget):
     area_selected = pyqtSignal(QRect)
@@ -122,7 +77,7 @@ class AreaSelector:
             overlay.showFullScreen()
             return overlay
         except Exception as e:
-            print(f"选择区域时出错: {e}")
+            get_logger().error(f"选择区域时出错: {e}")
             return None
 
 class CoordinateOverlay(QWidget):
@@ -169,11 +124,32 @@ class ImageTextRecognitionApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.recognition_thread = None
-        self.target_texts = ["瓦尔申", "督瑞尔", "格里戈利", "冰中野兽"]
+        self.target_texts = list(BOSS_NAMES)
         self.area_change_reward = None
         self.area_boss = None
         self.area_open = None
         self.down_coordinate = None
+        self.frame_source = None
+        # 按钮的候选文字，例如 {"change_reward_labels": ["更改奖励"], "open_labels": ["打开", "开启"]}
+        self.button_labels = {}
+        # 各区域的预处理和tesseract参数，例如 {"area_open": {"preprocess": {"scale": 2, "threshold": "otsu"}, "psm": 7}}
+        self.region_settings = {}
+        # OCR进程池的进程数，0表示不预读
+        self.ocr_workers = 3
+        self.ocr_pool = None
+        # 多客户端配置，界面上编辑的是顶层的默认设置
+        self.profiles = None
+        # 指标文件，例如 "metrics.json"，为空时不写
+        self.metrics_file = None
+        # 记录的boss列表布局，见 boss_layout.py
+        self.boss_layout = None
+        # 校准得到的文字小框，{区域: {目标: [x, y, w, h]}}
+        self.tracked_boxes = None
+        # 界面上没有控件的匹配设置：fuzzy_threshold、roi_tracking，保存时原样写回
+        self.match_settings = {}
+        self.log_settings = None
+        self.log_ring = setup_logging()
+        self._log_seq = 0
         self.initUI()
         
     def initUI(self):
@@ -242,20 +218,37 @@ class ImageTextRecognitionApp(QMainWindow):
         control_layout.addWidget(self.btn_start)
         control_layout.addWidget(self.btn_stop)
         click_layout.addLayout(control_layout)
-        # 日志
-        self.text_log = QTextEdit()
+        # 日志：只保留环形缓冲容量内的行，由定时器批量刷新
+        self.text_log = QPlainTextEdit()
         self.text_log.setReadOnly(True)
+        self.text_log.setMaximumBlockCount(self.log_ring.capacity)
         click_layout.addWidget(QLabel("操作日志:"))
         click_layout.addWidget(self.text_log)
         # 保存配置按钮
         self.btn_save_config = QPushButton("保存配置")
         self.btn_save_config.clicked.connect(self.save_config)
+        self.btn_calibrate = QPushButton("自动校准")
+        self.btn_calibrate.clicked.connect(self.calibrate_regions)
         config_layout = QHBoxLayout()
         config_layout.addWidget(self.btn_save_config)
+        config_layout.addWidget(self.btn_calibrate)
         config_layout.addStretch()
         click_layout.addLayout(config_layout)
         click_group.setLayout(click_layout)
         main_layout.addWidget(click_group)
+        # 运行统计
+        stats_group = QGroupBox("运行统计")
+        stats_layout = QVBoxLayout()
+        self.label_stats = QLabel("未运行")
+        stats_layout.addWidget(self.label_stats)
+        stats_group.setLayout(stats_layout)
+        main_layout.addWidget(stats_group)
+        self.stats_timer = QTimer(self)
+        self.stats_timer.timeout.connect(self.update_stats)
+        self.stats_timer.start(1000)
+        self.log_timer = QTimer(self)
+        self.log_timer.timeout.connect(self.flush_log)
+        self.log_timer.start(200)
         self.load_config()
 
     def start_recognition(self):
@@ -267,11 +260,12 @@ class ImageTextRecognitionApp(QMainWindow):
             return
         boss_text = self.target_combo.currentText()
         interval = self.spin_interval.value()
-        self.recognition_thread = RecognitionThread(
-            boss_text, interval, self.down_coordinate,
-            self.area_change_reward, self.area_boss, self.area_open
-        )
-        self.recognition_thread.update_signal.connect(self.log_message)
+        config = self.current_config()
+        started = time.perf_counter()
+        from workflow import create_pool
+        self.ocr_pool = create_pool(config, self.ocr_pool)
+        self.recognition_thread = RecognitionThread(config, self.ocr_pool)
+        self.log_message(f"识别模块加载耗时 {(time.perf_counter() - started) * 1000:.0f}ms")
         self.recognition_thread.finished_signal.connect(self.on_recognition_finished)
         self.recognition_thread.start()
         self.btn_start.setEnabled(False)
@@ -310,6 +304,34 @@ class ImageTextRecognitionApp(QMainWindow):
         self.log_message(f"已选择{self.get_area_name(area_type)}区域: {area_str}")
         self.show()
 
+    def calibrate_regions(self):
+        """隐藏窗口后整屏OCR一次，为当前画面上的目标建立跟踪小框"""
+        self.hide()
+        # 等窗口真正消失后再截屏
+        QTimer.singleShot(300, self._run_calibration)
+
+    def _run_calibration(self):
+        from app_config import region_targets
+        import text_recognition
+        try:
+            config = self.current_config()
+            areas = {"area_change_reward": self.area_change_reward, "area_boss": self.area_boss,
+                     "area_open": self.area_open}
+            boxes = text_recognition.calibrate(region_targets(config), areas)
+        finally:
+            self.show()
+        if not boxes:
+            self.log_message("校准未找到任何目标，请先打开游戏中包含目标文字的界面")
+            return
+        self.tracked_boxes = dict(self.tracked_boxes or {})
+        for region, found in boxes.items():
+            self.tracked_boxes[region] = dict(self.tracked_boxes.get(region) or {}, **found)
+            self.log_message(f"校准 {self.get_area_name(region.split('_')[1])}: {', '.join(found)}")
+        if self.match_settings.get("roi_tracking", True):
+            self.log_message("校准完成，下次开始识别时生效")
+        else:
+            self.log_message("校准完成，但配置中关闭了ROI跟踪（roi_tracking: false），开启后才会使用校准结果")
+
     def stop_recognition(self):
         if self.recognition_thread and self.recognition_thread.isRunning():
             self.recognition_thread.stop()
@@ -321,17 +343,59 @@ class ImageTextRecognitionApp(QMainWindow):
         self.btn_start.setEnabled(True)
         self.btn_stop.setEnabled(False)
         self.log_message("已停止识别")
+        from workflow import save_boss_layouts
+        if save_boss_layouts(self.recognition_thread.workflows):
+            # 只写回了布局，界面上保存的其它设置保持不变
+            config = load_config()
+            self.boss_layout = config.get("boss_layout")
+            if self.profiles:
+                self.profiles = config.get("profiles")
+            self.log_message("boss列表布局已写入配置")
 
     def log_message(self, message):
-        current_time = time.strftime("%H:%M:%S")
-        log_entry = f"[{current_time}] {message}"
-        print(log_entry)
-        self.text_log.append(log_entry)
-        self.text_log.verticalScrollBar().setValue(self.text_log.verticalScrollBar().maximum())
+        get_logger().info(message)
+
+    def flush_log(self):
+        """把环形缓冲中的新日志一次性追加到界面"""
+        self._log_seq, lines = self.log_ring.drain(self._log_seq)
+        if not lines:
+            return
+        scrollbar = self.text_log.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum() - 2
+        self.text_log.appendPlainText("\n".join(lines[-self.log_ring.capacity:]))
+        if at_bottom:
+            scrollbar.setValue(scrollbar.maximum())
+
+    def update_stats(self):
+        if not self.recognition_thread:
+            return
+        workflows = self.recognition_thread.workflows
+        lines = []
+        for workflow in workflows:
+            snapshot = workflow.stats.snapshot()
+            name = f"[{workflow.name}] " if workflow.name else ""
+            lines.append(
+                f"{name}完成 {snapshot['cycles_completed']}/{snapshot['cycles_started']} 轮，"
+                f"每小时 {snapshot['cycles_per_hour']:.1f} 轮，成功率 {snapshot['success_rate']:.0%}，"
+                f"平均重试 {snapshot['retries_per_cycle']:.2f} 次"
+            )
+        # 分阶段耗时只显示第一个客户端
+        snapshot = workflows[0].stats.snapshot()
+        stages = snapshot['stages']
+        for stage, name in (("capture", "截图"), ("gate", "特征门控"), ("preprocess", "预处理"), ("ocr", "OCR"),
+                            ("line_merge", "行合并"), ("click", "点击"), ("sleep", "等待"), ("cycle", "整轮")):
+            if stage in stages:
+                st = stages[stage]
+                lines.append(f"{name}: p50 {st['p50_ms']:.0f}ms  p90 {st['p90_ms']:.0f}ms  "
+                             f"共 {st['total_s']:.1f}s / {st['count']}次")
+        self.label_stats.setText("\n".join(lines))
 
     def closeEvent(self, event):
         if self.recognition_thread and self.recognition_thread.isRunning():
             self.recognition_thread.stop()
+        if self.ocr_pool:
+            self.ocr_pool.shutdown()
+        shutdown_logging()
         event.accept()
 
     def get_down_coordinate(self):
@@ -352,23 +416,52 @@ class ImageTextRecognitionApp(QMainWindow):
         self.log_message("已取消下滑坐标获取")
         self.show()
 
-    def save_config(self):
+    def current_config(self):
+        """界面上的当前设置，与 config.json 的格式相同"""
         config = {
             "area_change_reward": self.area_change_reward,
             "area_boss": self.area_boss,
             "area_open": self.area_open,
             "down_coordinate": self.down_coordinate,
             "interval": self.spin_interval.value(),
-            "boss_index": self.target_combo.currentIndex()
+            "boss_index": self.target_combo.currentIndex(),
+            "ocr_workers": self.ocr_workers
         }
-        with open("config.json", "w", encoding="utf-8") as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
+        if self.frame_source:
+            config["frame_source"] = self.frame_source
+        if self.button_labels:
+            config["button_labels"] = self.button_labels
+        if self.region_settings:
+            config["region_settings"] = self.region_settings
+        if self.metrics_file:
+            config["metrics_file"] = self.metrics_file
+        if self.log_settings:
+            config["log"] = self.log_settings
+        if self.profiles:
+            config["profiles"] = self.profiles
+        if self.tracked_boxes:
+            config["tracked_boxes"] = self.tracked_boxes
+        if self.boss_layout is not None:
+            config["boss_layout"] = self.boss_layout
+        config.update(self.match_settings)
+        return config
+
+    def save_config(self):
+        save_config(self.current_config())
         self.log_message("配置已保存到 config.json")
 
     def load_config(self):
-        if os.path.exists("config.json"):
-            with open("config.json", "r", encoding="utf-8") as f:
-                config = json.load(f)
+        config = load_config()
+        if config:
+            if config.get("log"):
+                # 例如 {"level": "INFO", "file": "bossmanager.jsonl", "verbose_ocr": false}
+                self.log_settings = config["log"]
+                self.log_ring = setup_logging(
+                    level=self.log_settings.get("level", "INFO"),
+                    log_file=self.log_settings.get("file"),
+                    verbose_ocr=self.log_settings.get("verbose_ocr", False),
+                )
+                self._log_seq = 0
             if config.get("area_change_reward"):
                 self.area_change_reward = tuple(config["area_change_reward"])
                 self.label_area_change.setText(f"已选择区域: {self.area_change_reward}")
@@ -385,31 +478,43 @@ class ImageTextRecognitionApp(QMainWindow):
                 self.spin_interval.setValue(config["interval"])
             if config.get("boss_index") is not None:
                 self.target_combo.setCurrentIndex(config["boss_index"])
+            if config.get("profiles"):
+                self.profiles = config["profiles"]
+                self.log_message(f"多客户端: {', '.join(p.get('name', '?') for p in self.profiles)}")
+            if config.get("metrics_file"):
+                self.metrics_file = config["metrics_file"]
+            if config.get("ocr_workers") is not None:
+                self.ocr_workers = config["ocr_workers"]
+            if config.get("region_settings"):
+                self.region_settings = config["region_settings"]
+            if "boss_layout" in config:
+                self.boss_layout = config["boss_layout"]
+            if config.get("tracked_boxes"):
+                self.tracked_boxes = config["tracked_boxes"]
+            self.match_settings = {key: config[key] for key in ("fuzzy_threshold", "roi_tracking", "verify_clicks") if key in config}
+            if config.get("button_labels"):
+                self.button_labels = config["button_labels"]
+            if config.get("frame_source"):
+                # 例如 {"type": "replay", "path": "recordings"}，开始识别时生效
+                self.frame_source = config["frame_source"]
+                self.log_message(f"画面来源: {self.frame_source.get('type', 'screen')}")
             self.log_message("已加载本地配置")
 
-    def capture_screen(self):
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            try:
-                if self.roi:
-                    x, y, w, h = self.roi
-                    if w <= 0 or h <= 0:
-                        print("区域宽高非法！")
-                        return None
-                    screenshot = ImageGrab.grab(bbox=(x, y, x+w, y+h))
-                else:
-                    screenshot = ImageGrab.grab()
-                # 保存截图到本地，便于人工检查
-                screenshot.save("debug_capture.png")
-                return np.array(screenshot)
-            except Exception as e:
-                print("截图异常：", e)
-                return None
-
 def main():
+    # PyInstaller打包后OCR进程池需要
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = ImageTextRecognitionApp()
     window.show()
+
+    def report_startup():
+        # 事件循环开始处理事件时窗口已经显示
+        elapsed = (time.perf_counter() - _STARTUP_T0) * 1000
+        window.log_message(f"启动耗时 {elapsed:.0f}ms")
+        if "--startup-time" in sys.argv:
+            print(f"startup_ms={elapsed:.1f}")
+            app.quit()
+    QTimer.singleShot(0, report_startup)
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
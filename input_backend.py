@@ -0,0 +1,26 @@
+import threading
+
+
+class InputBackend:
+    """鼠标输入接口"""
+
+    def click(self, x, y):
+        raise NotImplementedError
+
+
+class PyAutoGUIInput(InputBackend):
+    """通过pyautogui点击屏幕
+
+    所有实例共用一把锁：多个客户端同时运行时，只有真正的鼠标点击需要排队，
+    避免两个点击的移动和按下交错到不同窗口。
+    """
+    _lock = threading.Lock()
+
+    def click(self, x, y):
+        import pyautogui
+        with self._lock:
+            pyautogui.click(x, y)
+
+
+# 默认的输入后端
+default_input = PyAutoGUIInput()
@@ -0,0 +1,142 @@
+from collections import deque
+
+
+class AhoCorasick:
+    """多模式串匹配自动机，一次扫描行文本即可找出所有目标文字"""
+
+    def __init__(self, patterns):
+        self.patterns = list(dict.fromkeys(p for p in patterns if p))
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for pattern in self.patterns:
+            self._add(pattern)
+        self._build()
+
+    def _add(self, pattern):
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = nxt
+        self._output[node].append(pattern)
+
+    def _build(self):
+        """广度优先计算失败指针，并合并后缀节点的输出"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+    def finditer(self, text):
+        """依次产出 (起始下标, 目标文字)"""
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for pattern in self._output[node]:
+                yield i - len(pattern) + 1, pattern
+
+
+# chi_sim 常见的形近误识字，两两之间替换代价较低
+CONFUSABLE_GROUPS = (
+    "瓦互凡", "尔尓示小", "申中甲由电串", "中巾串", "督智替", "瑞端喘揣", "格恪络洛",
+    "里黑星量", "戈弋划找", "利刹刺和科", "冰水沐", "野墅理", "兽善曾鲁",
+    "更吏史便", "改故玫政", "奖将桨浆", "励历厉劢", "打扛灯汀", "开升井并幵",
+)
+CONFUSABLES = {}
+for _group in CONFUSABLE_GROUPS:
+    for _ch in _group:
+        CONFUSABLES.setdefault(_ch, set()).update(c for c in _group if c != _ch)
+CONFUSABLE_COST = 0.3
+
+
+def substitution_cost(a, b):
+    """替换代价：相同为0，形近字为 CONFUSABLE_COST，其它为1"""
+    if a == b:
+        return 0.0
+    if b in CONFUSABLES.get(a, ()):
+        return CONFUSABLE_COST
+    return 1.0
+
+
+def fuzzy_find(text, pattern):
+    """在text中找与pattern编辑距离最小的子串，返回 (起始下标, 结束下标, 代价)
+
+    匹配可以从任意位置开始（Sellers算法），替换代价考虑形近字，插入和删除代价为1。
+    """
+    n = len(text)
+    prev = [0.0] * (n + 1)
+    prev_start = list(range(n + 1))
+    for i, pc in enumerate(pattern, 1):
+        cur = [float(i)] + [0.0] * n
+        cur_start = [0] * (n + 1)
+        for j in range(1, n + 1):
+            best = prev[j - 1] + substitution_cost(pc, text[j - 1])
+            start = prev_start[j - 1]
+            if prev[j] + 1 < best:
+                best, start = prev[j] + 1, prev_start[j]
+            if cur[j - 1] + 1 < best:
+                best, start = cur[j - 1] + 1, cur_start[j - 1]
+            cur[j] = best
+            cur_start[j] = start
+        prev, prev_start = cur, cur_start
+    end = min(range(n + 1), key=lambda j: (prev[j], -j))
+    return prev_start[end], end, prev[end]
+
+
+class FuzzyMatcher:
+    """先用自动机做精确匹配，没有精确命中的目标再做容错匹配
+
+    finditer 产出 (起始下标, 结束下标, 目标文字, 置信度)，search 在多行中查找并额外产出行号，
+    置信度 = 1 - 编辑代价 / 目标长度，低于 threshold 的容错结果会被丢弃。
+    """
+
+    def __init__(self, patterns, threshold=0.75):
+        self.exact = AhoCorasick(patterns)
+        self.patterns = self.exact.patterns
+        self.threshold = threshold
+
+    def finditer(self, text):
+        for _, start, end, pattern, score in self.search([text]):
+            yield start, end, pattern, score
+
+    def search(self, texts):
+        """在多行文字中查找，产出 (行号, 起始下标, 结束下标, 目标文字, 置信度)
+
+        先对所有行做精确匹配，任何一行精确命中的目标都不再做容错匹配；
+        其余目标在所有行中只取置信度最高的一处（同分取靠前的行），
+        避免前面行的形近误识抢在后面行的精确结果之前。
+        """
+        found = set()
+        for index, text in enumerate(texts):
+            for start, pattern in self.exact.finditer(text):
+                found.add(pattern)
+                yield index, start, start + len(pattern), pattern, 1.0
+        if self.threshold >= 1:
+            return
+        for pattern in self.patterns:
+            if pattern in found:
+                continue
+            best = None
+            for index, text in enumerate(texts):
+                if not text:
+                    continue
+                start, end, cost = fuzzy_find(text, pattern)
+                score = 1 - cost / len(pattern)
+                if score >= self.threshold and end > start and (best is None or score > best[4]):
+                    best = (index, start, end, pattern, score)
+            if best is not None:
+                yield best
@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from clock import real_clock
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# 直方图桶的上界（毫秒），最后一个桶收集更慢的样本
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+def rss_bytes():
+    """当前进程的常驻内存（字节），优先用psutil，没有时读 /proc，都不可用时返回None"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def percentile(sorted_values, q):
+    """线性插值求分位数，sorted_values需已排序"""
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q
+    low = int(pos)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (pos - low)
+
+
+def histogram(values_ms, buckets=HISTOGRAM_BUCKETS_MS):
+    """按桶统计样本数，返回与 buckets 等长再加一个溢出桶的计数列表"""
+    counts = [0] * (len(buckets) + 1)
+    for value in values_ms:
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    return counts
+
+
+class StageTimer:
+    """按阶段记录耗时（秒），每个阶段只保留最近 maxlen 次，maxlen为None时不限
+
+    window 不为None时只统计最近 window 秒内的样本，形成滚动窗口。
+    """
+
+    def __init__(self, maxlen=1000, window=None):
+        self.maxlen = maxlen
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage, seconds):
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.maxlen)
+            samples.append((time.monotonic(), seconds))
+
+    def summary(self, with_histogram=False):
+        """返回 {阶段: {count, total_s, mean_ms, p50_ms, p90_ms, p99_ms, max_ms}}"""
+        cutoff = time.monotonic() - self.window if self.window else None
+        with self._lock:
+            snapshot = {}
+            for stage, samples in self._samples.items():
+                if cutoff is not None:
+                    while samples and samples[0][0] < cutoff:
+                        samples.popleft()
+                snapshot[stage] = sorted(value for _, value in samples)
+        result = {}
+        for stage, values in snapshot.items():
+            if not values:
+                continue
+            total = sum(values)
+            result[stage] = {
+                'count': len(values),
+                'total_s': total,
+                'mean_ms': total / len(values) * 1000,
+                'p50_ms': percentile(values, 0.5) * 1000,
+                'p90_ms': percentile(values, 0.9) * 1000,
+                'p99_ms': percentile(values, 0.99) * 1000,
+                'max_ms': values[-1] * 1000,
+            }
+            if with_histogram:
+                result[stage]['histogram'] = histogram(v * 1000 for v in values)
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+
+class RunStats:
+    """一次运行的统计：轮数、成功/重试率和各阶段耗时，可定期写入指标文件"""
+
+    def __init__(self, timings=None, metrics_file=None, write_interval=5.0, clock=None):
+        self.timings = timings or StageTimer(window=3600)
+        self.metrics_file = metrics_file
+        self.write_interval = write_interval
+        # 模拟运行时传入虚拟时钟，轮数/小时按虚拟时间计算
+        self.clock = clock or real_clock
+        self.started = self.clock.now()
+        self.cycles_started = 0
+        self.cycles_completed = 0
+        self.retries = 0
+        self.timeouts = 0
+        # 点击后画面没有变化而重新点击的次数
+        self.click_retries = 0
+        self._last_write = 0.0
+
+    def cycles_per_hour(self):
+        hours = (self.clock.now() - self.started) / 3600
+        return self.cycles_completed / hours if hours > 0 else 0.0
+
+    def snapshot(self):
+        started = self.cycles_started
+        return {
+            'uptime_s': self.clock.now() - self.started,
+            'cycles_started': started,
+            'cycles_completed': self.cycles_completed,
+            'cycles_per_hour': self.cycles_per_hour(),
+            'success_rate': self.cycles_completed / started if started else 0.0,
+            'retries': self.retries,
+            'retries_per_cycle': self.retries / started if started else 0.0,
+            'timeouts': self.timeouts,
+            'click_retries': self.click_retries,
+            'stages': self.timings.summary(with_histogram=True),
+            'histogram_buckets_ms': list(HISTOGRAM_BUCKETS_MS),
+        }
+
+    def maybe_write(self, force=False):
+        """距上次写入超过 write_interval 秒时写指标文件"""
+        if not self.metrics_file:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_write < self.write_interval:
+            return
+        self._last_write = now
+        tmp = self.metrics_file + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.metrics_file)
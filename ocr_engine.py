@@ -0,0 +1,283 @@
+import importlib.util
+import math
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from app_log import get_logger
+
+# Tesseract OCR引擎路径
+TESSERACT_CMD = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+# 神经网络OCR模型目录：det.onnx（文字检测）、rec.onnx（文字识别）、keys.txt（字符表）
+ONNX_MODEL_DIR = 'models'
+
+
+def tesserocr_available():
+    """只检查是否安装，真正导入推迟到创建引擎时"""
+    return importlib.util.find_spec('tesserocr') is not None
+
+
+def default_tessdata_path():
+    """根据tesseract.exe的位置推断tessdata目录"""
+    tessdata = os.path.join(os.path.dirname(TESSERACT_CMD), 'tessdata')
+    if os.path.isdir(tessdata):
+        return tessdata
+    return None
+
+
+class OCREngine:
+    """OCR引擎接口
+
+    image_to_data 返回与 pytesseract.Output.DICT 相同结构的字典：
+    text / left / top / width / height / conf 六个等长列表。
+    """
+    name = "base"
+
+    def __init__(self, lang='chi_sim', psm=6):
+        self.lang = lang
+        self.psm = psm
+
+    def image_to_data(self, image, psm=None, whitelist=None):
+        """psm为None时使用引擎默认值，whitelist限制可识别的字符"""
+        raise NotImplementedError
+
+    def close(self):
+        """释放引擎资源"""
+        pass
+
+
+class PytesseractEngine(OCREngine):
+    """每次调用都启动一次tesseract进程（兼容旧实现，作为兜底）"""
+    name = "pytesseract"
+
+    def __init__(self, lang='chi_sim', psm=6):
+        super().__init__(lang, psm)
+        import pytesseract
+        # 设置Tesseract OCR引擎路径
+        pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+        self._pytesseract = pytesseract
+
+    def image_to_data(self, image, psm=None, whitelist=None):
+        custom_config = f'--oem 3 --psm {psm or self.psm}'
+        if whitelist:
+            custom_config += f' -c tessedit_char_whitelist={whitelist}'
+        return self._pytesseract.image_to_data(image, lang=self.lang,
+                                               output_type=self._pytesseract.Output.DICT,
+                                               config=custom_config)
+
+
+class TesserocrEngine(OCREngine):
+    """常驻进程内的libtesseract句柄，模型只在启动时加载一次"""
+    name = "tesserocr"
+
+    def __init__(self, lang='chi_sim', psm=6, tessdata=None):
+        super().__init__(lang, psm)
+        try:
+            import tesserocr
+        except ImportError:
+            raise RuntimeError("未安装tesserocr，无法使用常驻OCR引擎")
+        self._tesserocr = tesserocr
+        kwargs = {'lang': lang, 'psm': psm, 'oem': tesserocr.OEM.DEFAULT}
+        tessdata = tessdata or default_tessdata_path()
+        if tessdata:
+            kwargs['path'] = tessdata
+        self._api = tesserocr.PyTessBaseAPI(**kwargs)
+        # libtesseract句柄不是线程安全的
+        self._lock = threading.Lock()
+
+    def image_to_data(self, image, psm=None, whitelist=None):
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        data = {'text': [], 'left': [], 'top': [], 'width': [], 'height': [], 'conf': []}
+        with self._lock:
+            self._api.SetPageSegMode(psm or self.psm)
+            self._api.SetVariable('tessedit_char_whitelist', whitelist or '')
+            self._api.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+            self._api.Recognize()
+            tesserocr = self._tesserocr
+            level = tesserocr.RIL.WORD
+            for item in tesserocr.iterate_level(self._api.GetIterator(), level):
+                text = item.GetUTF8Text(level)
+                box = item.BoundingBox(level)
+                if not text or box is None:
+                    continue
+                x1, y1, x2, y2 = box
+                data['text'].append(text)
+                data['left'].append(x1)
+                data['top'].append(y1)
+                data['width'].append(x2 - x1)
+                data['height'].append(y2 - y1)
+                data['conf'].append(item.Confidence(level))
+        return data
+
+    def close(self):
+        with self._lock:
+            self._api.End()
+
+
+class OnnxOCREngine(OCREngine):
+    """CPU上运行的轻量神经网络OCR：DB文字检测 + CRNN/CTC文字识别，通过onnxruntime推理
+
+    模型为 PaddleOCR 导出的 ONNX 格式，model_dir 中需要 det.onnx、rec.onnx 和字符表 keys.txt（每行一个字符）。
+    一张图中检测出的所有文字行在一次识别推理中批量完成，多个区域拼接后提交时也只推理一次；
+    psm 为单行模式（7/8/13）时跳过检测，整张图作为一行识别。whitelist 通过屏蔽其它字符的输出实现。
+    """
+    name = "onnx"
+    SINGLE_LINE_PSM = (7, 8, 13)
+    REC_HEIGHT = 48
+    DET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+    DET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+    def __init__(self, lang='chi_sim', psm=6, model_dir=None, threads=None, det_limit=960,
+                 det_threshold=0.3, box_threshold=0.5, unclip_ratio=1.6, rec_batch=16, rec_max_width=960):
+        super().__init__(lang, psm)
+        try:
+            import onnxruntime
+        except ImportError:
+            raise RuntimeError("未安装onnxruntime，无法使用神经网络OCR引擎")
+        model_dir = model_dir or ONNX_MODEL_DIR
+        paths = [os.path.join(model_dir, name) for name in ('det.onnx', 'rec.onnx', 'keys.txt')]
+        missing = [path for path in paths if not os.path.exists(path)]
+        if missing:
+            raise RuntimeError(f"缺少模型文件: {', '.join(missing)}")
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        providers = ['CPUExecutionProvider']
+        self._det = onnxruntime.InferenceSession(paths[0], options, providers=providers)
+        self._rec = onnxruntime.InferenceSession(paths[1], options, providers=providers)
+        self._det_input = self._det.get_inputs()[0].name
+        self._rec_input = self._rec.get_inputs()[0].name
+        with open(paths[2], 'r', encoding='utf-8') as f:
+            # 输出第0类为CTC空白，字符表之后还有一个空格类
+            self._keys = [line.rstrip('\r\n') for line in f] + [' ']
+        self.det_limit = det_limit
+        self.det_threshold = det_threshold
+        self.box_threshold = box_threshold
+        self.unclip_ratio = unclip_ratio
+        self.rec_batch = rec_batch
+        self.rec_max_width = rec_max_width
+        self._masks = {}
+
+    def _detect(self, rgb):
+        """返回文字行的外接矩形 [(x, y, w, h), ...]，按从上到下、从左到右排序"""
+        h, w = rgb.shape[:2]
+        scale = min(1.0, self.det_limit / max(h, w))
+        # DB网络要求边长为32的倍数
+        det_h = max(32, int(round(h * scale / 32)) * 32)
+        det_w = max(32, int(round(w * scale / 32)) * 32)
+        image = cv2.resize(rgb, (det_w, det_h)).astype(np.float32) / 255
+        image = (image - self.DET_MEAN) / self.DET_STD
+        prob = self._det.run(None, {self._det_input: image.transpose(2, 0, 1)[None]})[0][0, 0]
+        mask = (prob > self.det_threshold).astype(np.uint8)
+        contours, _ = cv2.findContours(mask, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        sx, sy = w / det_w, h / det_h
+        boxes = []
+        for contour in contours:
+            x, y, bw, bh = cv2.boundingRect(contour)
+            if bw < 3 or bh < 3 or prob[y:y + bh, x:x + bw].mean() < self.box_threshold:
+                continue
+            # DB输出的是收缩后的文字核心区域，按 unclip_ratio 向外扩回完整文字
+            pad = bw * bh * self.unclip_ratio / (2 * (bw + bh))
+            x0, y0 = max(0, int((x - pad) * sx)), max(0, int((y - pad) * sy))
+            x1, y1 = min(w, int(math.ceil((x + bw + pad) * sx))), min(h, int(math.ceil((y + bh + pad) * sy)))
+            boxes.append((x0, y0, x1 - x0, y1 - y0))
+        boxes.sort(key=lambda b: (b[1], b[0]))
+        return boxes
+
+    def _mask(self, whitelist, classes):
+        """白名单以外的字符类（保留CTC空白）"""
+        key = (whitelist, classes)
+        mask = self._masks.get(key)
+        if mask is None:
+            allowed = set(whitelist)
+            mask = np.array([i > 0 and (i > len(self._keys) or self._keys[i - 1] not in allowed)
+                             for i in range(classes)])
+            self._masks[key] = mask
+        return mask
+
+    def _recognize(self, rgb, boxes, whitelist):
+        """批量识别各文字行，返回 [(文字, 置信度), ...]"""
+        crops = [rgb[y:y + h, x:x + w] for x, y, w, h in boxes]
+        results = [('', 0.0)] * len(crops)
+        # 按宽高比排序后分批，减少同一批内的补白
+        order = sorted(range(len(crops)), key=lambda i: crops[i].shape[1] / max(1, crops[i].shape[0]))
+        for start in range(0, len(order), self.rec_batch):
+            chunk = order[start:start + self.rec_batch]
+            widths = [min(self.rec_max_width, max(1, int(math.ceil(
+                self.REC_HEIGHT * crops[i].shape[1] / max(1, crops[i].shape[0]))))) for i in chunk]
+            batch = np.zeros((len(chunk), 3, self.REC_HEIGHT, max(widths)), dtype=np.float32)
+            for n, (i, width) in enumerate(zip(chunk, widths)):
+                line = cv2.resize(crops[i], (width, self.REC_HEIGHT)).astype(np.float32)
+                batch[n, :, :, :width] = (line / 255 - 0.5).transpose(2, 0, 1) / 0.5
+            probs = self._rec.run(None, {self._rec_input: batch})[0]
+            if whitelist:
+                probs = probs.copy()
+                probs[:, :, self._mask(whitelist, probs.shape[2])] = 0
+            indices = probs.argmax(axis=2)
+            scores = probs.max(axis=2)
+            for n, i in enumerate(chunk):
+                chars, confs, prev = [], [], 0
+                for t, k in enumerate(indices[n]):
+                    if k != 0 and k != prev and k <= len(self._keys):
+                        chars.append(self._keys[k - 1])
+                        confs.append(scores[n, t])
+                    prev = k
+                results[i] = (''.join(chars).strip(), float(np.mean(confs)) * 100 if confs else 0.0)
+        return results
+
+    def image_to_data(self, image, psm=None, whitelist=None):
+        rgb = image if image.ndim == 3 else cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+        h, w = rgb.shape[:2]
+        if (psm or self.psm) in self.SINGLE_LINE_PSM:
+            boxes = [(0, 0, w, h)]
+        else:
+            boxes = self._detect(rgb)
+        data = {'text': [], 'left': [], 'top': [], 'width': [], 'height': [], 'conf': []}
+        for (x, y, bw, bh), (text, conf) in zip(boxes, self._recognize(rgb, boxes, whitelist) if boxes else ()):
+            if not text:
+                continue
+            data['text'].append(text)
+            data['left'].append(x)
+            data['top'].append(y)
+            data['width'].append(bw)
+            data['height'].append(bh)
+            data['conf'].append(conf)
+        return data
+
+
+def create_engine(name=None, lang='chi_sim', psm=6):
+    """创建OCR引擎，默认优先使用常驻的tesserocr，不可用时退回pytesseract
+
+    name 可取 auto / tesserocr / pytesseract / onnx，onnx 不可用时同样退回默认引擎。
+    """
+    if name == 'onnx':
+        try:
+            return OnnxOCREngine(lang, psm)
+        except RuntimeError as e:
+            get_logger().warning("神经网络OCR引擎初始化失败，退回默认引擎: %s", e)
+            name = None
+    if name in (None, 'auto'):
+        name = 'tesserocr' if tesserocr_available() else 'pytesseract'
+    if name == 'tesserocr':
+        try:
+            return TesserocrEngine(lang, psm)
+        except RuntimeError as e:
+            get_logger().warning("常驻OCR引擎初始化失败，退回pytesseract: %s", e)
+    return PytesseractEngine(lang, psm)
+
+
+_shared_engines = {}
+_shared_lock = threading.Lock()
+
+
+def shared_engine(name, lang='chi_sim'):
+    """按名称取进程内共用的引擎，模型只加载一次（按区域选择引擎时使用）"""
+    with _shared_lock:
+        engine = _shared_engines.get((name, lang))
+        if engine is None:
+            engine = _shared_engines[(name, lang)] = create_engine(name, lang)
+        return engine
@@ -0,0 +1,42 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from ocr_engine import create_engine, shared_engine
+
+# 工作进程内常驻的OCR引擎
+_engine = None
+_lang = 'chi_sim'
+
+
+def _init_worker(engine_name, lang):
+    global _engine, _lang
+    _engine = create_engine(engine_name, lang)
+    _lang = lang
+
+
+def _image_to_data(image, psm, whitelist, engine_name=None):
+    # 指定了其它引擎的区域，在工作进程内按需加载一次
+    engine = _engine if engine_name in (None, 'auto', _engine.name) else shared_engine(engine_name, _lang)
+    return engine.image_to_data(image, psm, whitelist)
+
+
+class OCRWorkerPool:
+    """OCR进程池，每个工作进程启动时加载一次模型，多个区域的OCR可以真正并行"""
+
+    def __init__(self, workers=None, engine_name=None, lang='chi_sim'):
+        self.workers = workers or min(3, os.cpu_count() or 1)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(engine_name, lang),
+        )
+
+    def submit(self, image, psm=None, whitelist=None, engine_name=None):
+        """提交一张预处理后的图像，返回结果为 image_to_data 字典的 Future
+
+        engine_name 为该区域指定的引擎，为None时用进程池的默认引擎。
+        """
+        return self._executor.submit(_image_to_data, image, psm, whitelist, engine_name)
+
+    def shutdown(self, wait=False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,92 @@
+import cv2
+import numpy as np
+
+
+class PreprocessPipeline:
+    """按配置编译好的区域预处理流程，创建一次后重复使用
+
+    配置示例（均可省略）::
+
+        {"mask": {"space": "hsv", "lower": [0, 0, 180], "upper": [180, 60, 255]},
+         "scale": 2, "threshold": "otsu", "invert": false}
+
+    mask 会把颜色范围内的像素当作文字（黑字白底），threshold 可取 "otsu"、"adaptive" 或 0-255 的整数。
+    """
+
+    def __init__(self, spec=None):
+        self.spec = dict(spec or {})
+        self.scale = float(self.spec.get('scale', 1) or 1)
+        self._steps = []
+        mask = self.spec.get('mask')
+        if mask:
+            self._steps.append(self._mask_step(mask))
+        if self.scale != 1:
+            interpolation = cv2.INTER_CUBIC if self.scale > 1 else cv2.INTER_AREA
+            scale = self.scale
+            self._steps.append(lambda img, rgb: cv2.resize(img, None, fx=scale, fy=scale,
+                                                           interpolation=interpolation))
+        threshold = self.spec.get('threshold')
+        if threshold is not None and not mask:
+            self._steps.append(self._threshold_step(threshold))
+        if self.spec.get('invert'):
+            self._steps.append(lambda img, rgb: cv2.bitwise_not(img))
+
+    @staticmethod
+    def _mask_step(mask):
+        lower = np.array(mask['lower'], dtype=np.uint8)
+        upper = np.array(mask['upper'], dtype=np.uint8)
+        hsv = mask.get('space', 'hsv') == 'hsv'
+
+        def step(img, rgb):
+            src = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV) if hsv else rgb
+            return cv2.bitwise_not(cv2.inRange(src, lower, upper))
+        return step
+
+    @staticmethod
+    def _threshold_step(threshold):
+        if threshold == 'otsu':
+            return lambda img, rgb: cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+        if threshold == 'adaptive':
+            return lambda img, rgb: cv2.adaptiveThreshold(img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                                          cv2.THRESH_BINARY, 31, 10)
+        value = int(threshold)
+        return lambda img, rgb: cv2.threshold(img, value, 255, cv2.THRESH_BINARY)[1]
+
+    def __call__(self, rgb, gray):
+        """返回送给OCR的图像，坐标需要除以 self.scale 映射回区域"""
+        image = gray
+        for step in self._steps:
+            image = step(image, rgb)
+        return image
+
+
+def build_whitelist(targets):
+    """由已知目标文字生成tesseract字符白名单"""
+    return ''.join(sorted(set(''.join(targets))))
+
+
+class RegionSettings:
+    """单个识别区域的预处理流程、OCR引擎和tesseract参数"""
+
+    def __init__(self, spec=None, targets=()):
+        spec = dict(spec or {})
+        self.pipeline = PreprocessPipeline(spec.get('preprocess'))
+        self.psm = spec.get('psm', 6)
+        whitelist = spec.get('whitelist')
+        if whitelist == 'auto':
+            whitelist = build_whitelist(targets) or None
+        self.whitelist = whitelist
+        # 该区域使用的OCR引擎（auto / tesserocr / pytesseract / onnx），为None时用识别器的默认引擎
+        self.engine = spec.get('engine')
+        # 是否在OCR前用像素特征排除明显没有按钮的画面，只适合按钮区域
+        self.gate = spec.get('gate', False)
+
+
+# 按钮区域很小，默认按单行识别，省去整页版面分析。
+# 字符白名单需在 region_settings 中显式开启（"whitelist": "auto"）：限制字符后框内无关的文字
+# 也会被识别成按钮文字的字形，容易误判为按钮存在
+DEFAULT_REGION_SETTINGS = {
+    'area_change_reward': {'psm': 7, 'gate': True},
+    'area_boss': {'psm': 6},
+    'area_open': {'psm': 7, 'gate': True},
+}
@@ -0,0 +1,175 @@
+from collections import OrderedDict
+
+from clock import real_clock
+
+
+def _clip(box, area):
+    """把 (x, y, w, h) 裁剪到 area 以内，area 为 None 时不裁剪"""
+    if area is None:
+        return box
+    x, y, w, h = box
+    ax, ay, aw, ah = area
+    x0, y0 = max(x, ax), max(y, ay)
+    x1, y1 = min(x + w, ax + aw), min(y + h, ay + ah)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def _union(boxes):
+    x0 = min(b[0] for b in boxes)
+    y0 = min(b[1] for b in boxes)
+    x1 = max(b[0] + b[2] for b in boxes)
+    y1 = max(b[1] + b[3] for b in boxes)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def _contains(outer, inner):
+    return (outer[0] <= inner[0] and outer[1] <= inner[1]
+            and inner[0] + inner[2] <= outer[0] + outer[2] and inner[1] + inner[3] <= outer[1] + outer[3])
+
+
+class BoxTracker:
+    """按 (区域, 目标文字) 记录文字所在的小框，之后只对小框做OCR
+
+    命中时把文字外接矩形加上边距作为下一次的搜索框；文字仍在框内时框保持不变，
+    这样模板缓存和画面指纹的键也保持稳定。未命中时以框中心逐次放大 grow 倍，
+    放大到覆盖整个用户区域后放弃跟踪，回到完整区域搜索。坐标均为屏幕坐标。
+    """
+
+    def __init__(self, margin=1.0, min_margin=8, grow=2.0):
+        self.margin = margin          # 边距，按文字高度的倍数
+        self.min_margin = min_margin  # 最小边距（像素）
+        self.grow = grow
+        self._boxes = {}
+        self._active = {}
+        self.lost = 0
+
+    def clear(self):
+        self._boxes.clear()
+        self._active.clear()
+
+    def boxes(self):
+        """返回 {区域: {目标: 搜索框}}，可写入配置"""
+        result = {}
+        for (region, target), entry in self._boxes.items():
+            result.setdefault(region, {})[target] = list(entry['box'])
+        return result
+
+    def seed(self, boxes):
+        """载入 boxes() 格式的搜索框（例如校准结果）"""
+        for region, targets in (boxes or {}).items():
+            for target, box in targets.items():
+                self._boxes[(region, target)] = {'box': tuple(box), 'misses': 0}
+
+    def _search_box(self, entry):
+        x, y, w, h = entry['box']
+        factor = self.grow ** entry['misses']
+        if factor == 1:
+            return entry['box']
+        new_w, new_h = int(w * factor), int(h * factor)
+        return x + w // 2 - new_w // 2, y + h // 2 - new_h // 2, new_w, new_h
+
+    def search_roi(self, region, targets, area):
+        """返回查找这些目标时要OCR的区域：全部目标都有搜索框时取它们的并集，否则为完整区域"""
+        if region is None:
+            return area
+        self._active[region] = tuple(targets)
+        boxes = []
+        for target in targets:
+            entry = self._boxes.get((region, target))
+            if entry is None:
+                return area
+            box = _clip(self._search_box(entry), area)
+            if box is None or (area is not None and _contains(box, area)):
+                # 放大后已覆盖整个区域（或跑出区域），不再跟踪
+                del self._boxes[(region, target)]
+                return area
+            boxes.append(box)
+        return _union(boxes) if boxes else area
+
+    def active_roi(self, region, area):
+        """该区域最近一次查找的目标对应的搜索框，用于预读"""
+        targets = self._active.get(region)
+        return self.search_roi(region, targets, area) if targets else area
+
+    def hit(self, region, target, box):
+        """目标在 box（屏幕坐标的文字外接矩形）处被找到"""
+        entry = self._boxes.get((region, target))
+        if entry is not None and entry['misses'] == 0 and _contains(entry['box'], box):
+            return
+        x, y, w, h = box
+        margin = max(int(h * self.margin), self.min_margin)
+        self._boxes[(region, target)] = {'box': (x - margin, y - margin, w + 2 * margin, h + 2 * margin),
+                                         'misses': 0}
+
+    def miss(self, region, target):
+        """在搜索框内没有找到目标，下次放大搜索范围"""
+        entry = self._boxes.get((region, target))
+        if entry is not None:
+            entry['misses'] += 1
+            self.lost += 1
+
+
+class PositionTracker:
+    """按目标文字记录最近的点击坐标，用于检查位置是否稳定和预测点击点
+
+    最多保留 max_targets 个目标，超出时淘汰最久未见的；超过 ttl 秒未见的记录作废，
+    之后再看到时按首次出现处理。连续 stable_count 次出现在误差范围内的目标可以预测点击点，
+    只有这样的目标位置跳变时才需要再读一次确认。
+    """
+
+    def __init__(self, max_targets=64, ttl=60.0, tolerance=10, stable_count=2, clock=None):
+        self.max_targets = max_targets
+        self.ttl = ttl
+        self.tolerance = tolerance
+        self.stable_count = stable_count
+        self.clock = clock or real_clock
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _entry(self, text, now):
+        entry = self._entries.get(text)
+        if entry is not None and now - entry['time'] > self.ttl:
+            del self._entries[text]
+            return None
+        return entry
+
+    def check(self, text, x, y, tolerance=None):
+        """记录一次出现，返回位置是否可信
+
+        首次出现、与之前位置相近或之前的位置还不能预测时为True；能预测点击点的目标位置跳变时为False。
+        """
+        tolerance = self.tolerance if tolerance is None else tolerance
+        now = self.clock.now()
+        entry = self._entry(text, now)
+        if entry is None:
+            self._entries[text] = {'pos': (x, y), 'count': 1, 'time': now}
+            while len(self._entries) > self.max_targets:
+                self._entries.popitem(last=False)
+            return True
+        self._entries.move_to_end(text)
+        entry['time'] = now
+        last_x, last_y = entry['pos']
+        if abs(x - last_x) <= tolerance and abs(y - last_y) <= tolerance:
+            # 位置取平均，抵消OCR外接框的抖动
+            entry['count'] += 1
+            entry['pos'] = (last_x + (x - last_x) / entry['count'], last_y + (y - last_y) / entry['count'])
+            return True
+        # 之前的位置还没稳定时没有可信的参照，直接采用新位置，省去一次确认读取
+        stable = entry['count'] >= self.stable_count
+        entry['pos'] = (x, y)
+        entry['count'] = 1
+        return not stable
+
+    def predict(self, text):
+        """位置稳定时返回预测的点击点，否则返回None"""
+        entry = self._entry(text, self.clock.now())
+        if entry is None or entry['count'] < self.stable_count:
+            return None
+        return int(round(entry['pos'][0])), int(round(entry['pos'][1]))
+
+    def clear(self):
+        self._entries.clear()
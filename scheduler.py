@@ -0,0 +1,111 @@
+import heapq
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from app_log import get_logger
+from clock import real_clock
+from text_recognition import submit_reads
+
+
+class ProfileScheduler:
+    """在一个调度器里交错执行多个客户端的流程
+
+    每个流程的 step() 返回下一次探测的等待秒数，调度器按到期时间把步骤派发到线程池，
+    同一个流程同一时间只有一个步骤在执行。OCR走共用的进程池，鼠标点击由输入后端串行化。
+    最早到期之后 batch_window 秒内到期的流程一起派发，派发前把它们要识别的区域拼成一张图预读，
+    N 个客户端的查找只调用一次OCR。
+    """
+
+    def __init__(self, workflows, workers=None, tick=0.2, clock=None, batch_window=0.05):
+        self.workflows = list(workflows)
+        self.clock = clock or real_clock
+        self.workers = workers or max(1, len(self.workflows))
+        self.tick = tick  # 等待期间检查停止标志的最长间隔
+        self.batch_window = batch_window
+        self.batched_reads = 0  # 拼在一起预读的区域数
+        self.stop_event = threading.Event()
+        self.log = get_logger()
+
+    @property
+    def running(self):
+        return not self.stop_event.is_set()
+
+    def stop(self):
+        self.stop_event.set()
+        for workflow in self.workflows:
+            workflow.stop()
+
+    def _ready_at(self, queue, window):
+        """下一次派发的时刻：等最早到期之后 window 秒内到期的流程也到期"""
+        horizon = queue[0][0] + window
+        return max(due for due, _ in queue if due <= horizon)
+
+    def _prefetch(self, indices):
+        """同时派发的流程要OCR的区域拼成一张图一起预读，只有一个区域时照常在流程里识别"""
+        groups = {}
+        for i in indices:
+            workflow = self.workflows[i]
+            read = workflow.next_read()
+            if read is None or workflow.recognizer.pool is None:
+                continue
+            try:
+                job = workflow.recognizer.read_job(*read)
+            except Exception as e:
+                self.log.warning(f"流程 {workflow.name or i} 预读失败: {e}")
+                continue
+            if job is not None:
+                pool = workflow.recognizer.pool
+                groups.setdefault(id(pool), (pool, []))[1].append(job)
+        for pool, jobs in groups.values():
+            if len(jobs) > 1:
+                submit_reads(jobs, pool)
+                self.batched_reads += len(jobs)
+
+    def run(self):
+        """运行到所有流程结束或被停止"""
+        now = self.clock.now()
+        queue = [(now, i) for i in range(len(self.workflows))]
+        heapq.heapify(queue)
+        pending = {}
+        # 只有共用OCR进程池时才值得等待凑批
+        window = self.batch_window if any(w.recognizer.pool is not None for w in self.workflows) else 0.0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="profile") as executor:
+            while self.running and (queue or pending):
+                now = self.clock.now()
+                if queue and self._ready_at(queue, window) <= now:
+                    due = []
+                    while queue and queue[0][0] <= now:
+                        due.append(heapq.heappop(queue)[1])
+                    if len(due) > 1:
+                        self._prefetch(due)
+                    for i in due:
+                        pending[executor.submit(self.workflows[i].step)] = i
+                timeout = self.tick
+                if queue:
+                    timeout = min(timeout, max(0.0, self._ready_at(queue, window) - now))
+                if pending:
+                    # 虚拟时间不会自己流逝，等正在执行的步骤结束即可
+                    done, _ = wait(pending, timeout=None if self.clock.virtual else timeout,
+                                   return_when=FIRST_COMPLETED)
+                else:
+                    self.clock.wait(self.stop_event, timeout)
+                    continue
+                for future in done:
+                    i = pending.pop(future)
+                    workflow = self.workflows[i]
+                    try:
+                        delay = future.result()
+                    except Exception as e:
+                        self.log.exception(f"流程 {workflow.name or i} 出错: {e}")
+                        delay = None
+                    if delay is not None and workflow.running:
+                        workflow.stats.timings.record('sleep', delay)
+                        heapq.heappush(queue, (self.clock.now() + delay, i))
+            # 停止时等待正在执行的步骤结束
+            wait(pending)
+        for workflow in self.workflows:
+            try:
+                workflow.finish()
+            finally:
+                # GUI 每次开始/停止都会新建流程，画面来源要在这里释放，否则截图线程和缓冲会越积越多
+                workflow.close()
@@ -0,0 +1,494 @@
+"""本地游戏画面模拟器：不需要游戏，用虚拟时钟加速跑完整的 更改奖励 → boss → 打开 流程
+
+模拟器按点击坐标切换 奖励 / boss列表（可下滑翻页）/ 打开 三个画面，切换有随机的加载延迟；
+配合 SimulatedOCREngine 可以按比例注入误识别和漏识别，统计吞吐量和各种失败情况::
+
+    python simulator.py --cycles 2000 --misread 0.05 --miss 0.02
+    python simulator.py --assets sim_assets --engine tesserocr   # 用素材图和真实OCR
+
+素材目录（可选）中 background.png 为整屏背景，labels/<文字>.png 为各按钮和boss名称的截图；
+没有素材时每个文字画成一个灰度编码的色块，只有 SimulatedOCREngine 能识别。
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+from app_config import BOSS_NAMES, CHANGE_REWARD_LABELS, OPEN_LABELS, region_targets
+from app_log import setup_logging, shutdown_logging
+from clock import VirtualClock, real_clock
+from frame_source import FrameSource, ScreenFrameSource, _clip_roi
+from input_backend import InputBackend
+from matcher import CONFUSABLES
+from ocr_engine import OCREngine, create_engine
+
+# 没有素材时文字色块的灰度：CODE_BASE + CODE_STEP * 文字序号
+CODE_BASE = 16
+CODE_STEP = 12
+BACKGROUND = 255
+TEXT_HEIGHT = 22
+CHAR_WIDTH = 20
+
+
+def _read_image(path, size=None):
+    """读取素材图（支持中文路径），返回RGB；不存在时返回None"""
+    if not os.path.exists(path):
+        return None
+    bgr = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if bgr is None:
+        return None
+    if size is not None:
+        bgr = cv2.resize(bgr, size, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+
+class GameSimulator(FrameSource):
+    """模拟的游戏画面，同时作为画面来源和点击目标
+
+    时间来自 clock，点击后的画面切换在 transition 范围内的随机延迟后生效，
+    期间的点击被忽略。boss列表每页显示 rows_per_page 行，shuffle 为True时每轮打乱顺序。
+    drop 为游戏没有响应点击（点击丢失）的概率。画面超过 stuck_timeout 秒没有切换时
+    调用 on_stuck（流程卡住，例如"打开"的点击丢失后一直在等"更改奖励"）。
+    """
+    REWARD = "reward"
+    BOSS_LIST = "boss_list"
+    OPEN = "open"
+
+    # 画面布局（屏幕坐标）
+    CHANGE_REWARD_POS = (560, 600)
+    OPEN_POS = (600, 612)
+    BOSS_LIST_POS = (520, 180)
+    ROW_SPACING = 60
+    DOWN_POS = (800, 420)
+    DOWN_RADIUS = 20
+
+    def __init__(self, clock=None, width=1280, height=720, boss_names=BOSS_NAMES,
+                 change_reward_labels=CHANGE_REWARD_LABELS, open_labels=OPEN_LABELS,
+                 rows_per_page=3, shuffle=False, transition=(0.2, 1.0), assets=None, seed=0, drop=0.0,
+                 stuck_timeout=300.0):
+        self.clock = clock or real_clock
+        self.width = width
+        self.height = height
+        self.boss_names = list(boss_names)
+        self.change_reward_label = change_reward_labels[0]
+        self.open_label = open_labels[0]
+        self.labels = [self.change_reward_label] + self.boss_names + [self.open_label]
+        self.rows_per_page = rows_per_page
+        self.shuffle = shuffle
+        self.transition = transition
+        self.drop = drop
+        self.stuck_timeout = stuck_timeout
+        self.on_stuck = None
+        self.random = random.Random(seed)
+        self._background = None
+        self._label_images = {}
+        if assets:
+            self._background = _read_image(os.path.join(assets, 'background.png'), (width, height))
+            for text in self.labels:
+                image = _read_image(os.path.join(assets, 'labels', f'{text}.png'))
+                if image is not None:
+                    self._label_images[text] = image
+        self._frames = {}
+        self.counters = {'clicks': 0, 'ignored': 0, 'dropped': 0, 'misclicks': 0, 'scrolls': 0, 'opened': 0}
+        self.opened = {}
+        self.reset()
+
+    def reset(self):
+        """回到奖励画面（流程中途失败后重新开始时调用）"""
+        self.screen = self.REWARD
+        self.page = 0
+        self.order = list(self.boss_names)
+        self.selected = None
+        self._pending = None
+        self.stuck = False
+        self._switched = self.clock.now()
+
+    # 画面内容
+
+    def _box(self, text, pos):
+        return pos[0], pos[1], CHAR_WIDTH * len(text), TEXT_HEIGHT
+
+    def items(self):
+        """当前画面上的文字和外接矩形 [(文字, (x, y, w, h)), ...]"""
+        if self.screen == self.REWARD:
+            return [(self.change_reward_label, self._box(self.change_reward_label, self.CHANGE_REWARD_POS))]
+        if self.screen == self.OPEN:
+            return [(self.open_label, self._box(self.open_label, self.OPEN_POS))]
+        start = self.page * self.rows_per_page
+        x, y = self.BOSS_LIST_POS
+        return [(name, self._box(name, (x, y + row * self.ROW_SPACING)))
+                for row, name in enumerate(self.order[start:start + self.rows_per_page])]
+
+    def config(self, boss=None):
+        """与模拟画面布局一致的配置，可直接交给 RewardWorkflow.from_config"""
+        return {
+            "area_change_reward": [500, 570, 280, 80],
+            "area_boss": [440, 140, 400, 260],
+            "area_open": [500, 590, 280, 80],
+            "down_coordinate": list(self.DOWN_POS),
+            "boss": boss or self.boss_names[0],
+            "interval": 15,
+        }
+
+    def _render(self):
+        key = (self.screen, self.page, tuple(self.order))
+        frame = self._frames.get(key)
+        if frame is not None:
+            return frame
+        if self._background is not None:
+            frame = self._background.copy()
+        else:
+            frame = np.full((self.height, self.width, 3), BACKGROUND, dtype=np.uint8)
+        for text, (x, y, w, h) in self.items():
+            image = self._label_images.get(text)
+            if image is not None:
+                frame[y:y + image.shape[0], x:x + image.shape[1]] = image
+            else:
+                frame[y:y + h, x:x + w] = CODE_BASE + CODE_STEP * self.labels.index(text)
+        if self.screen == self.BOSS_LIST:
+            # 下滑箭头，颜色接近背景，不会被当成文字
+            x, y = self.DOWN_POS
+            cv2.fillConvexPoly(frame, np.array([(x - 12, y - 6), (x + 12, y - 6), (x, y + 8)]), (242, 242, 242))
+        self._frames[key] = frame
+        return frame
+
+    # 画面切换
+
+    def _update(self):
+        if self._pending is not None and self.clock.now() >= self._pending[0]:
+            _, self.screen, self.page = self._pending
+            self._pending = None
+            self._switched = self.clock.now()
+        elif (self.on_stuck is not None and not self.stuck
+              and self.clock.now() - self._switched > self.stuck_timeout):
+            self.stuck = True
+            self.on_stuck()
+
+    def _switch(self, screen, page=0):
+        delay = self.random.uniform(*self.transition)
+        self._pending = (self.clock.now() + delay, screen, page)
+
+    def click(self, x, y):
+        self._update()
+        self.counters['clicks'] += 1
+        if self._pending is not None:
+            self.counters['ignored'] += 1
+            return
+        if self.drop and self.random.random() < self.drop:
+            # 游戏没有响应这次点击
+            self.counters['dropped'] += 1
+            return
+        hit = None
+        for text, (bx, by, bw, bh) in self.items():
+            if bx <= x < bx + bw and by <= y < by + bh:
+                hit = text
+                break
+        if self.screen == self.REWARD and hit == self.change_reward_label:
+            if self.shuffle:
+                self.random.shuffle(self.order)
+            self._switch(self.BOSS_LIST)
+        elif self.screen == self.BOSS_LIST and hit is not None:
+            self.selected = hit
+            self._switch(self.OPEN)
+        elif (self.screen == self.BOSS_LIST
+              and abs(x - self.DOWN_POS[0]) <= self.DOWN_RADIUS and abs(y - self.DOWN_POS[1]) <= self.DOWN_RADIUS):
+            self.counters['scrolls'] += 1
+            last_page = (len(self.order) - 1) // self.rows_per_page
+            self._switch(self.BOSS_LIST, min(self.page + 1, last_page))
+        elif self.screen == self.OPEN and hit == self.open_label:
+            self.counters['opened'] += 1
+            self.opened[self.selected] = self.opened.get(self.selected, 0) + 1
+            self._switch(self.REWARD)
+        else:
+            self.counters['misclicks'] += 1
+
+    # FrameSource 接口
+
+    def screen_size(self):
+        return self.width, self.height
+
+    def grab(self, roi=None):
+        self._update()
+        frame = self._render()
+        if roi is None:
+            return frame
+        x0, y0, x1, y1 = _clip_roi(roi, self.width, self.height)
+        return frame[y0:y1, x0:x1]
+
+
+class SimulatorScreen(ScreenFrameSource):
+    """走实时屏幕截图的缓冲区复用路径，画面内容从模拟器拷贝，用于检查截图缓冲区的内存占用"""
+
+    def __init__(self, simulator, max_buffers=16):
+        super().__init__(max_buffers)
+        self.simulator = simulator
+
+    def screen_size(self):
+        return self.simulator.screen_size()
+
+    def grab_into(self, roi, out):
+        np.copyto(out, self.simulator.grab(roi))
+        return out
+
+    def invalidate(self):
+        self.simulator.invalidate()
+
+
+class SimulatorInput(InputBackend):
+    """把点击转给模拟器"""
+
+    def __init__(self, simulator):
+        self.simulator = simulator
+
+    def click(self, x, y):
+        self.simulator.click(x, y)
+
+
+class SimulatedOCREngine(OCREngine):
+    """识别模拟器画出的灰度编码色块，可按比例注入误识别和漏识别
+
+    misread 为把一个字替换成形近字（没有形近字时换成白名单或其它目标中的字）的概率，
+    miss 为整个文字没有识别出来的概率；latency 为每次OCR消耗的虚拟时间（秒）。
+    """
+    name = "simulated"
+
+    def __init__(self, labels, misread=0.0, miss=0.0, latency=0.0, clock=None, seed=0):
+        super().__init__()
+        self.labels = list(labels)
+        self.misread = misread
+        self.miss = miss
+        self.latency = latency
+        self.clock = clock
+        self.random = random.Random(seed)
+        self.calls = 0
+        self._chars = sorted(set(''.join(self.labels)))
+
+    def _misread_text(self, text, whitelist):
+        i = self.random.randrange(len(text))
+        choices = sorted(CONFUSABLES.get(text[i], ())) or self._chars
+        if whitelist:
+            choices = [c for c in choices if c in whitelist] or [c for c in whitelist if c != text[i]]
+        if not choices:
+            return text
+        return text[:i] + self.random.choice(choices) + text[i + 1:]
+
+    def image_to_data(self, image, psm=None, whitelist=None):
+        self.calls += 1
+        if self.clock is not None and self.latency:
+            self.clock.advance(self.latency)
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        mask = (gray < 240).astype(np.uint8)
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=4)
+        data = {'text': [], 'left': [], 'top': [], 'width': [], 'height': [], 'conf': []}
+        for x, y, w, h, area in stats[1:count]:
+            if area < 20:
+                continue
+            value = int(gray[y + h // 2, x + w // 2])
+            index = round((value - CODE_BASE) / CODE_STEP)
+            if not 0 <= index < len(self.labels) or abs(CODE_BASE + CODE_STEP * index - value) > 3:
+                continue
+            if self.random.random() < self.miss:
+                continue
+            text = self.labels[index]
+            conf = 95
+            if self.random.random() < self.misread:
+                text = self._misread_text(text, whitelist)
+                conf = 60
+            data['text'].append(text)
+            data['left'].append(int(x))
+            data['top'].append(int(y))
+            data['width'].append(int(w))
+            data['height'].append(int(h))
+            data['conf'].append(conf)
+        return data
+
+
+class SynchronousPool:
+    """在本进程内立即执行的OCR进程池替身，用于在模拟器中统计预读的命中率和多做的OCR"""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def submit(self, image, psm=None, whitelist=None, engine_name=None):
+        future = Future()
+        future.set_result(self.engine.image_to_data(image, psm, whitelist))
+        return future
+
+    def shutdown(self, wait=False):
+        pass
+
+
+def run_simulation(cycles=1000, boss=None, misread=0.0, miss=0.0, latency=0.0, engine=None,
+                   assets=None, seed=0, max_failures=100, shuffle=False, boss_layout=True, workflow_options=None,
+                   drop=0.0, pool=False, use_cache=True, screen_buffers=False):
+    """用虚拟时钟跑 cycles 轮，流程中途失败时重置画面重新开始，返回统计结果
+
+    screen_buffers 为True时识别器经 SimulatorScreen 截图，与实时屏幕一样拷贝进复用的缓冲区。
+    """
+    from text_recognition import TextRecognizer
+    from workflow import RewardWorkflow
+
+    clock = VirtualClock()
+    simulator = GameSimulator(clock=clock, shuffle=shuffle, assets=assets, seed=seed, drop=drop)
+    config = simulator.config(boss)
+    if not boss_layout:
+        config["boss_layout"] = False
+    if engine is None:
+        engine = SimulatedOCREngine(simulator.labels, misread, miss, latency, clock, seed)
+    frame_source = SimulatorScreen(simulator) if screen_buffers else simulator
+    recognizer = TextRecognizer(engine=engine, frame_source=frame_source)
+    recognizer.configure_regions(None, region_targets(config))
+    recognizer.set_clock(clock)
+    recognizer.use_cache = use_cache
+    if pool:
+        recognizer.set_pool(SynchronousPool(engine))
+    options = dict(workflow_options or {})
+    options.update(recognizer=recognizer, input_backend=SimulatorInput(simulator), clock=clock, log=lambda msg: None)
+
+    completed = failures = retries = timeouts = click_retries = 0
+    started = time.perf_counter()
+    while completed < cycles and failures <= max_failures:
+        workflow = RewardWorkflow.from_config(config, max_cycles=cycles - completed, **options)
+        simulator.on_stuck = workflow.stop
+        workflow.run()
+        completed += workflow.cycles
+        retries += workflow.stats.retries
+        timeouts += workflow.stats.timeouts
+        click_retries += workflow.stats.click_retries
+        if workflow.boss_layout is not None:
+            # 重新开始时沿用已记录的布局，相当于写回配置
+            config["boss_layout"] = workflow.boss_layout.to_config()
+        if simulator.stuck or not workflow.stop_event.is_set():
+            # 流程中途失败：回到奖励画面重新开始
+            failures += 1
+            simulator.reset()
+    elapsed = time.perf_counter() - started
+    virtual_hours = clock.now() / 3600
+    return {
+        'boss': config['boss'],
+        'cycles': completed,
+        'failures': failures,
+        'retries': retries,
+        'click_retries': click_retries,
+        'timeouts': timeouts,
+        'wrong_boss': sum(n for name, n in simulator.opened.items() if name != config['boss']),
+        'simulator': dict(simulator.counters),
+        'ocr_calls': getattr(engine, 'calls', None),
+        'virtual_hours': virtual_hours,
+        'cycles_per_hour': completed / virtual_hours if virtual_hours else 0.0,
+        'elapsed_s': elapsed,
+        'cycles_per_second': completed / elapsed if elapsed else 0.0,
+        'latency': recognizer.timings.summary(),
+        'cache': recognizer.cache_stats(),
+    }
+
+
+def run_profiles(profiles=3, cycles=100, misread=0.0, miss=0.0, seed=0):
+    """多个客户端各自一个模拟画面，共用一个进程池替身，经调度器一起运行
+
+    用来检查同时到期的客户端是否拼在一起预读：返回OCR调用次数、拼接预读的区域数和预读命中情况。
+    """
+    from scheduler import ProfileScheduler
+    from text_recognition import TextRecognizer
+    from workflow import RewardWorkflow
+
+    clock = VirtualClock()
+    simulators = [GameSimulator(clock=clock, seed=seed + k) for k in range(profiles)]
+    engine = SimulatedOCREngine(simulators[0].labels, misread, miss, 0.0, clock, seed)
+    pool = SynchronousPool(engine)
+    workflows = []
+    for k, simulator in enumerate(simulators):
+        config = simulator.config(BOSS_NAMES[k % len(BOSS_NAMES)])
+        recognizer = TextRecognizer(engine=engine, frame_source=simulator)
+        recognizer.configure_regions(None, region_targets(config))
+        recognizer.set_clock(clock)
+        recognizer.set_pool(pool)
+        workflows.append(RewardWorkflow.from_config(
+            config, max_cycles=cycles, recognizer=recognizer, input_backend=SimulatorInput(simulator),
+            clock=clock, log=lambda msg: None, name=f"client{k}"))
+    scheduler = ProfileScheduler(workflows, clock=clock)
+    scheduler.run()
+    return {
+        'profiles': profiles,
+        'cycles': [workflow.cycles for workflow in workflows],
+        'ocr_calls': engine.calls,
+        'batched_reads': scheduler.batched_reads,
+        'speculative_requests': sum(w.recognizer.speculative_requests for w in workflows),
+        'speculative_hits': sum(w.recognizer.speculative_hits for w in workflows),
+        'virtual_hours': clock.now() / 3600,
+    }
+
+
+def print_report(result):
+    print(f"boss: {result['boss']}，完成 {result['cycles']} 轮，虚拟时间 {result['virtual_hours']:.1f} 小时"
+          f"（每小时 {result['cycles_per_hour']:.1f} 轮），实际耗时 {result['elapsed_s']:.1f} 秒"
+          f"（每秒 {result['cycles_per_second']:.1f} 轮）")
+    sim = result['simulator']
+    print(f"  中途失败 {result['failures']} 次，下滑重试 {result['retries']} 次，超时 {result['timeouts']} 次，"
+          f"选错boss {result['wrong_boss']} 次，误点 {sim['misclicks']} 次，加载中被忽略的点击 {sim['ignored']} 次")
+    if sim['dropped'] or result['click_retries']:
+        print(f"  丢失的点击 {sim['dropped']} 次，画面无变化重新点击 {result['click_retries']} 次")
+    if result['ocr_calls'] is not None:
+        print(f"  OCR调用 {result['ocr_calls']} 次，缓存命中率 {result['cache']['hit_rate']:.0%}")
+    cache = result['cache']
+    if cache.get('speculative_requests'):
+        print(f"  预读 {cache['speculative_requests']} 次，命中 {cache['speculative_hits']} 次"
+              f"（命中率 {cache['speculative_hit_rate']:.0%}）")
+    if cache.get('gate_rejects'):
+        print(f"  像素特征门控跳过OCR {cache['gate_rejects']} 次，抽查漏判 {cache['gate_false_negatives']} 次")
+    for stage, stats in result['latency'].items():
+        print(f"  {stage:<10} n={stats['count']:<6} p50={stats['p50_ms']:.2f}ms p99={stats['p99_ms']:.2f}ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="用模拟画面和虚拟时钟测试识别流程的吞吐量和失败情况")
+    parser.add_argument('--cycles', type=int, default=1000, help="要完成的轮数")
+    parser.add_argument('--boss', help=f"boss名称，可选: {'/'.join(BOSS_NAMES)}")
+    parser.add_argument('--misread', type=float, default=0.0, help="每个文字被误识别一个字的概率")
+    parser.add_argument('--miss', type=float, default=0.0, help="每个文字漏识别的概率")
+    parser.add_argument('--latency', type=float, default=0.0, help="每次OCR消耗的虚拟时间(秒)")
+    parser.add_argument('--engine', default='sim', help="OCR引擎: sim / auto / tesserocr / pytesseract")
+    parser.add_argument('--assets', help="素材目录，使用真实OCR时需要")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子")
+    parser.add_argument('--pool', action='store_true', help="启用预读（用同步执行的进程池替身）")
+    parser.add_argument('--drop', type=float, default=0.0, help="游戏没有响应点击的概率")
+    parser.add_argument('--shuffle', action='store_true', help="每轮打乱boss列表顺序")
+    parser.add_argument('--no-layout', action='store_true', help="不记录boss列表布局，每轮完整查找")
+    parser.add_argument('--no-cache', action='store_true', help="关闭画面/模板/门控缓存，每次查找都做OCR")
+    parser.add_argument('--profiles', type=int, default=1, help="同时运行的客户端数，大于1时经调度器运行并统计拼接预读")
+    parser.add_argument('--max-failures', type=int, default=100, help="中途失败超过该次数后放弃")
+    parser.add_argument('--output', help="结果写入的JSON文件")
+    args = parser.parse_args(argv)
+
+    setup_logging(level="WARNING", console=True)
+    if args.profiles > 1:
+        try:
+            result = run_profiles(args.profiles, args.cycles, args.misread, args.miss, args.seed)
+        finally:
+            shutdown_logging()
+        print(f"{result['profiles']} 个客户端，完成 {result['cycles']} 轮，虚拟时间 {result['virtual_hours']:.1f} 小时")
+        print(f"  OCR调用 {result['ocr_calls']} 次，拼接预读 {result['batched_reads']} 个区域，"
+              f"预读命中 {result['speculative_hits']}/{result['speculative_requests']} 次")
+        return 0 if min(result['cycles']) >= args.cycles else 1
+    engine = None if args.engine == 'sim' else create_engine(args.engine)
+    try:
+        result = run_simulation(args.cycles, args.boss, args.misread, args.miss, args.latency, engine,
+                                args.assets, args.seed, args.max_failures, args.shuffle, not args.no_layout,
+                                drop=args.drop, pool=args.pool, use_cache=not args.no_cache)
+    finally:
+        shutdown_logging()
+    print_report(result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 0 if result['cycles'] >= args.cycles else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,171 +1,888 @@
+import bisect
 import cv2
-import pytesseract
-import pyautogui
-import time
 import numpy as np
-from PIL import Image, ImageGrab
+import threading
 import warnings
-import re
-import json
-import os
+from array import array
+from collections import OrderedDict
+from matcher import FuzzyMatcher
+from roi_tracker import BoxTracker, PositionTracker
+from preprocess import RegionSettings, DEFAULT_REGION_SETTINGS
+from metrics import StageTimer
+from app_log import get_logger
+from input_backend import default_input
+from ocr_engine import shared_engine
+from frame_source import ScreenFrameSource
+from clock import real_clock
+
+log = get_logger("ocr")
 
 # 抑制PIL警告
 warnings.filterwarnings("ignore", category=UserWarning)
 
-# 设置Tesseract OCR引擎路径
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+# 画面变化检测
+class ChangeDetector:
+    """按区域保存缩略图指纹，画面没有变化时复用上一次的OCR结果"""
+
+    def __init__(self, size=(32, 32), threshold=6, max_entries=64):
+        self.size = size
+        self.threshold = threshold  # 缩略图单个像素允许的最大灰度差
+        # 跟踪小框会产生很多不同的区域，超过容量时淘汰最久未用的
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def fingerprint(self, gray):
+        """降采样得到缩略图指纹，INTER_AREA会平均掉像素噪声"""
+        return cv2.resize(gray, self.size, interpolation=cv2.INTER_AREA)
+
+    def lookup(self, key, thumb):
+        """画面未变化时返回缓存的结果，否则返回None"""
+        entry = self._cache.get(key)
+        if entry is not None and self.same(entry[0], thumb):
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def cached(self, key, thumb):
+        """画面是否与缓存一致（不计入命中统计）"""
+        entry = self._cache.get(key)
+        return entry is not None and self.same(entry[0], thumb)
+
+    def same(self, thumb_a, thumb_b):
+        """两个指纹是否可视为同一画面"""
+        return thumb_a.shape == thumb_b.shape and cv2.absdiff(thumb_a, thumb_b).max() <= self.threshold
+
+    def store(self, key, thumb, value):
+        self._cache[key] = (thumb, value)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def discard(self, key):
+        """丢弃区域的缓存结果，下一次查找重新OCR"""
+        self._cache.pop(key, None)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+# 模板匹配快速通道
+class TemplateCache:
+    """OCR命中后把目标文字的截图缓存为模板，之后优先用cv2.matchTemplate查找
+
+    模板按 (目标文字, 区域) 保存，并记录版本号和屏幕分辨率，二者任一变化即作废；
+    超过容量时淘汰最久未使用的模板。
+    """
+
+    def __init__(self, threshold=0.85, max_templates=32):
+        self.threshold = threshold
+        self.max_templates = max_templates
+        self.version = 1
+        self._templates = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def match(self, target, roi, gray, screen_size, record=True):
+        """匹配成功时返回区域内的点击坐标，否则返回None；record 为False时不计入命中统计"""
+        key = (target, roi)
+        entry = self._templates.get(key)
+        if entry is None:
+            return None
+        template = entry['image']
+        if (entry['version'] != self.version or entry['screen_size'] != screen_size
+                or template.shape[0] > gray.shape[0] or template.shape[1] > gray.shape[1]):
+            del self._templates[key]
+            return None
+        result = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        if max_val < self.threshold:
+            if record:
+                self.misses += 1
+            return None
+        if record:
+            self.hits += 1
+        self._templates.move_to_end(key)
+        off_x, off_y = entry['offset']
+        return max_loc[0] + off_x, max_loc[1] + off_y
+
+    def store(self, target, roi, gray, box, click_point, screen_size):
+        """保存模板，box为目标文字在区域内的 (x, y, w, h)，click_point为区域内的点击坐标"""
+        x, y, w, h = box
+        template = gray[y:y+h, x:x+w].copy()
+        # 纯色模板无法做归一化相关匹配
+        if template.size == 0 or template.std() < 1:
+            return
+        self._templates[(target, roi)] = {
+            'image': template,
+            'offset': (click_point[0] - x, click_point[1] - y),
+            'version': self.version,
+            'screen_size': screen_size,
+        }
+        self._templates.move_to_end((target, roi))
+        while len(self._templates) > self.max_templates:
+            self._templates.popitem(last=False)
+
+    def invalidate(self):
+        """作废所有模板（分辨率或主题变化时调用）"""
+        self.version += 1
+        self._templates.clear()
+
+# OCR前的像素特征门控
+class SignatureGate:
+    """按钮区域的像素特征门控
+
+    OCR找到按钮时记下按钮文字所在的屏幕框，并学习框内画面的HSV直方图（缩小到32x32后计算，
+    耗时远小于1毫秒）。之后同一框内的画面与特征明显不符（相关系数低于 threshold）时直接判为
+    按钮不存在，不再做OCR。每 audit_every 次拒绝、或距上次抽查超过 audit_interval 秒时抽查一次照常OCR，
+    找到了目标就记一次漏判，并直接换成新的特征（按钮外观已经变了，逐步混合会继续误拒）。
+    """
+
+    def __init__(self, threshold=0.5, size=(32, 32), bins=(16, 8, 16), learn_rate=0.2, audit_every=20,
+                 audit_interval=60.0, clock=None):
+        self.threshold = threshold
+        self.size = size
+        self.bins = list(bins)
+        self.learn_rate = learn_rate
+        self.audit_every = audit_every
+        # 轮询间隔很长时（如等"更改奖励"时每15秒一次）按次数抽查太慢，按时间兜底
+        self.audit_interval = audit_interval
+        self.clock = clock or real_clock
+        self._last_audit = None
+        self._signatures = {}  # 区域 -> (屏幕框, 直方图)
+        self.checks = 0
+        self.rejects = 0
+        self.audits = 0
+        self.false_negatives = 0
+
+    def _signature(self, screen, origin, box):
+        """screen 中屏幕框 box 的直方图，box 不完全在画面内时返回None"""
+        x, y = box[0] - origin[0], box[1] - origin[1]
+        if x < 0 or y < 0 or x + box[2] > screen.shape[1] or y + box[3] > screen.shape[0]:
+            return None
+        small = cv2.resize(screen[y:y + box[3], x:x + box[2]], self.size, interpolation=cv2.INTER_AREA)
+        hsv = cv2.cvtColor(small, cv2.COLOR_RGB2HSV)
+        # 色相-饱和度直方图区分颜色，亮度直方图区分灰白色按钮
+        hue = cv2.calcHist([hsv], [0, 1], None, self.bins[:2], [0, 180, 0, 256])
+        value = cv2.calcHist([hsv], [2], None, [self.bins[2]], [0, 256])
+        hist = np.concatenate((hue.ravel(), value.ravel()))
+        return cv2.normalize(hist, hist)
+
+    def _correlation(self, region, screen, origin):
+        """画面与已学特征的相关系数，还没学到特征或按钮框不在画面内时返回None"""
+        entry = self._signatures.get(region)
+        if entry is None:
+            return None
+        sig = self._signature(screen, origin, entry[0])
+        if sig is None:
+            return None
+        return cv2.compareHist(entry[1], sig, cv2.HISTCMP_CORREL)
+
+    def check(self, region, screen, origin):
+        """画面是否可能有按钮；还没学到特征或按钮框不在画面内时总是返回True"""
+        correlation = self._correlation(region, screen, origin)
+        if correlation is None:
+            return True
+        self.checks += 1
+        if correlation >= self.threshold:
+            return True
+        self.rejects += 1
+        return False
+
+    def peek(self, region, screen, origin):
+        """与 check 相同，但不计入统计也不触发抽查（预读判断是否需要OCR时使用）"""
+        correlation = self._correlation(region, screen, origin)
+        return correlation is None or correlation >= self.threshold
+
+    def should_audit(self):
+        """本次拒绝是否抽查"""
+        now = self.clock.now()
+        if self._last_audit is None:
+            self._last_audit = now
+        if self.rejects % self.audit_every == 0 or now - self._last_audit >= self.audit_interval:
+            self._last_audit = now
+            self.audits += 1
+            return True
+        return False
+
+    def learn(self, region, screen, origin, box, replace=False):
+        """按钮在屏幕框 box 处被找到；框位置变化或 replace 为True时直接换成新特征，否则逐步混合"""
+        sig = self._signature(screen, origin, box)
+        if sig is None:
+            return
+        entry = self._signatures.get(region)
+        if entry is not None and entry[0] == box and not replace:
+            sig = cv2.addWeighted(entry[1], 1 - self.learn_rate, sig, self.learn_rate, 0)
+        self._signatures[region] = (box, sig)
+
+    def box(self, region):
+        entry = self._signatures.get(region)
+        return entry[0] if entry else None
+
+    def clear(self):
+        self._signatures.clear()
+
+    def stats(self):
+        return {
+            'checks': self.checks,
+            'rejects': self.rejects,
+            'audits': self.audits,
+            'false_negatives': self.false_negatives,
+            # 抽查中漏判的比例，近似全部拒绝中的漏判率
+            'false_negative_rate': self.false_negatives / self.audits if self.audits else 0.0,
+        }
+
+# OCR结果的紧凑表示
+class TokenTable:
+    """一次OCR的文字块：文字列表加两个平铺的数组，不为每个文字块创建元组
+
+    boxes 为 array('i')，第 i 个文字块的 (x, y, w, h) 位于 boxes[4*i:4*i+4]，conf 为 array('f')。
+    只保留非空文字，坐标已按预处理的放大倍数换算回区域坐标。
+    """
+    __slots__ = ('texts', 'boxes', 'conf')
+
+    def __init__(self):
+        self.texts = []
+        self.boxes = array('i')
+        self.conf = array('f')
+
+    def __len__(self):
+        return len(self.texts)
+
+    @classmethod
+    def from_data(cls, data, scale=1):
+        """由 image_to_data 的结果创建"""
+        table = cls()
+        texts, boxes, conf = table.texts, table.boxes, table.conf
+        left, top, width, height, confs = data['left'], data['top'], data['width'], data['height'], data['conf']
+        for i, text in enumerate(data['text']):
+            if text.strip():
+                texts.append(text)
+                boxes.extend((int(left[i] / scale), int(top[i] / scale),
+                              int(width[i] / scale), int(height[i] / scale)))
+                conf.append(float(confs[i]))
+        return table
+
+
+# 批量OCR：多个区域拼成一张图只调用一次OCR
+BATCH_GAP = 32  # 区域之间空白分隔带的高度（像素）
+BATCH_PSM = 6   # 拼接后的画布有多行文字，不能用单行模式
+
+
+def stitch_images(images, gap=BATCH_GAP):
+    """把多张预处理后的灰度图从上到下拼到一张白色画布上，返回 (画布, 每张图的y起点列表)"""
+    width = max(image.shape[1] for image in images)
+    height = sum(image.shape[0] for image in images) + gap * (len(images) - 1)
+    canvas = np.full((height, width), 255, dtype=np.uint8)
+    offsets = []
+    y = 0
+    for image in images:
+        h, w = image.shape[:2]
+        canvas[y:y + h, :w] = image
+        offsets.append(y)
+        y += h + gap
+    return canvas, offsets
+
+
+def split_data(data, offsets, heights):
+    """把整张画布的 image_to_data 结果按文字块中心拆回各张图，坐标换算为各自图内的坐标"""
+    parts = [{key: [] for key in ('text', 'left', 'top', 'width', 'height', 'conf')} for _ in offsets]
+    for i, text in enumerate(data['text']):
+        top, h = data['top'][i], data['height'][i]
+        center = top + h / 2
+        n = bisect.bisect_right(offsets, center) - 1
+        # 落在分隔带里的文字块丢弃
+        if n < 0 or center >= offsets[n] + heights[n]:
+            continue
+        part = parts[n]
+        part['text'].append(text)
+        part['left'].append(data['left'][i])
+        part['top'].append(top - offsets[n])
+        part['width'].append(data['width'][i])
+        part['height'].append(h)
+        part['conf'].append(data['conf'][i])
+    return parts
+
+
+def batch_whitelist(settings_list):
+    """各区域白名单的并集，任一区域不限制字符时整批都不限制"""
+    whitelists = [settings.whitelist for settings in settings_list]
+    if not all(whitelists):
+        return None
+    return ''.join(sorted(set(''.join(whitelists))))
+
+
+def submit_reads(jobs, pool):
+    """把预读任务（TextRecognizer.read_job 的结果）提交到OCR进程池
+
+    使用同一个引擎的多个区域拼成一张图只调用一次OCR，任务可以来自不同的识别器；
+    结果记在各自的识别器上，查找该区域时画面未变就直接使用。
+    """
+    groups = {}
+    for job in jobs:
+        groups.setdefault(job['settings'].engine, []).append(job)
+    for engine, members in groups.items():
+        if len(members) == 1:
+            settings = members[0]['settings']
+            future = pool.submit(members[0]['image'], settings.psm, settings.whitelist, engine)
+            batch = None
+        else:
+            images = [job['image'] for job in members]
+            canvas, offsets = stitch_images(images)
+            future = pool.submit(canvas, BATCH_PSM, batch_whitelist([job['settings'] for job in members]), engine)
+            batch = (offsets, [image.shape[0] for image in images])
+        for index, job in enumerate(members):
+            recognizer = job['recognizer']
+            recognizer.speculative_requests += 1
+            recognizer._speculative[job['key']] = (job['thumb'], future, None if batch is None else (batch, index),
+                                                   job['settings'].pipeline.scale)
+
 
 # 文字识别类
 class TextRecognizer:
-    def __init__(self):
+    def __init__(self, engine=None, frame_source=None):
+        # OCR引擎常驻，模型只加载一次，所有区域复用；未指定时第一次在本进程做OCR才创建，
+        # 全部OCR都交给进程池时主进程不加载模型
+        self._engine = engine
+        self.frame_source = frame_source or ScreenFrameSource()
+        self.change_detector = ChangeDetector()
+        self.template_cache = TemplateCache()
+        self.gate = SignatureGate()
+        # 为False时每次查找前清空画面/模板/门控缓存，总是完整OCR（内存基准测试用）
+        self.use_cache = True
+        # 跟踪各目标文字所在的小框，为None时总是OCR整个区域
+        self.tracker = BoxTracker()
+        # 各目标最近的点击坐标，超时作废，模拟运行时把时钟换成虚拟时钟
+        self.positions = PositionTracker()
+        # 最近一次点击：{'target', 'point', 'roi', 'before'}，用于确认点击是否生效
+        self.last_click = None
+        self._matchers = {}
+        # 容错匹配的置信度下限，设为1时只做精确匹配
+        self.fuzzy_threshold = 0.75
+        self._default_settings = RegionSettings()
+        self.region_settings = {}
+        self.pool = None
+        self._speculative = {}
+        self.speculative_requests = 0
+        self.speculative_hits = 0
+        # 各阶段耗时：capture / preprocess / ocr / line_merge / template / click，保留最近一小时
+        self.timings = StageTimer(window=3600)
         self.roi = None  # 感兴趣区域 (x, y, width, height)
-        self.consecutive_count = 0
-        self.last_positions = []
-        self.last_check_time = 0
+        # 截图转灰度的输出缓冲区，跟踪小框尺寸多变，只保留最近用过的几种
+        self._gray_buffers = OrderedDict()
+        self.max_buffers = 16
     
+    @property
+    def engine(self):
+        if self._engine is None:
+            # 未指定引擎的识别器共用进程内的默认引擎
+            self._engine = shared_engine(None)
+        return self._engine
+
+    @engine.setter
+    def engine(self, engine):
+        self._engine = engine
+
     def set_roi(self, x, y, width, height):
         """设置识别区域"""
         self.roi = (x, y, width, height)
+
+    def configure_regions(self, settings=None, targets=None):
+        """按区域编译预处理流程和tesseract参数
+
+        settings 为 config.json 中的 region_settings，未配置的区域使用默认设置；
+        targets 为各区域可能出现的文字，用于生成字符白名单。
+        """
+        settings = settings or {}
+        targets = targets or {}
+        self.region_settings = {}
+        for name in set(DEFAULT_REGION_SETTINGS) | set(settings):
+            spec = settings.get(name, DEFAULT_REGION_SETTINGS.get(name))
+            self.region_settings[name] = RegionSettings(spec, targets.get(name, ()))
+        self.change_detector.clear()
+
+    def set_pool(self, pool):
+        """设置OCR进程池，为None时关闭预读"""
+        self.pool = pool
+        self._speculative.clear()
+
+    def speculate(self, regions):
+        """截一帧画面，把各区域提交到进程池预先OCR
+
+        regions 为 {区域名: (x, y, width, height)}。结果以Future保存（拼接提交时各区域共用一个），
+        之后查找该区域时若画面指纹与预读时一致就直接使用，否则丢弃重新识别。
+        """
+        if self.pool is None:
+            return
+        rois = [roi for roi in regions.values() if roi]
+        if not rois:
+            return
+        left = min(r[0] for r in rois)
+        top = min(r[1] for r in rois)
+        right = max(r[0] + r[2] for r in rois)
+        bottom = max(r[1] + r[3] for r in rois)
+        frame = self.frame_source.grab((left, top, right - left, bottom - top))
+        jobs = []
+        for name, roi in regions.items():
+            if not roi:
+                continue
+            if self.tracker is not None:
+                roi = self.tracker.active_roi(name, tuple(roi))
+            x, y, w, h = roi
+            screen = frame[y - top:y - top + h, x - left:x - left + w]
+            gray = cv2.cvtColor(screen, cv2.COLOR_RGB2GRAY)
+            job = self._read_job(tuple(roi), screen, gray, self.region_settings.get(name) or self._default_settings)
+            if job is not None:
+                jobs.append(job)
+        submit_reads(jobs, self.pool)
+
+    def read_job(self, region, area, targets):
+        """为接下来的 find_many(targets, area, region) 准备预读任务
+
+        与 find_many 使用相同的跟踪小框、门控、模板和画面缓存判断，确实需要OCR时截图、预处理并返回任务，
+        否则返回None。多个客户端同时到期时调度器把各自的任务交给 submit_reads 一起提交。
+        """
+        if self.pool is None or not area or not self.use_cache:
+            return None
+        roi = tuple(area)
+        if self.tracker is not None:
+            roi = tuple(self.tracker.search_roi(region, targets, roi))
+        screen = self.frame_source.grab(roi)
+        gray = cv2.cvtColor(screen, cv2.COLOR_RGB2GRAY)
+        settings = self.region_settings.get(region)
+        if settings is not None and settings.gate and not self.gate.peek(region, screen, roi[:2]):
+            return None
+        screen_size = self.frame_source.screen_size()
+        if all(self.template_cache.match(target, roi, gray, screen_size, record=False) is not None
+               for target in targets):
+            return None
+        return self._read_job(roi, screen, gray, settings or self._default_settings)
+
+    def _read_job(self, key, screen, gray, settings):
+        """预处理一个区域的画面，画面与缓存一致（查找时直接复用缓存）时返回None"""
+        thumb = self.change_detector.fingerprint(gray)
+        if self.change_detector.cached(key, thumb):
+            return None
+        # 旧的预读结果可能与其它区域共用Future，不取消，直接丢弃
+        self._speculative.pop(key, None)
+        return {'recognizer': self, 'key': key, 'thumb': thumb, 'image': settings.pipeline(screen, gray),
+                'settings': settings}
+
+    def _take_speculative(self, roi, thumb):
+        """取出与当前画面一致的预读结果"""
+        entry = self._speculative.pop(roi, None)
+        if entry is None:
+            return None
+        old_thumb, future, batch, scale = entry
+        if not self.change_detector.same(old_thumb, thumb):
+            if batch is None:
+                future.cancel()
+            return None
+        try:
+            data = future.result()
+        except Exception as e:
+            log.warning("预读OCR失败: %s", e)
+            return None
+        if batch is not None:
+            (offsets, heights), index = batch
+            data = split_data(data, offsets, heights)[index]
+        self.speculative_hits += 1
+        return self.merge_lines(data, scale)
+
+    def cache_stats(self):
+        """返回OCR缓存命中统计"""
+        stats = self.change_detector.stats()
+        stats['speculative_requests'] = self.speculative_requests
+        stats['speculative_hits'] = self.speculative_hits
+        stats['speculative_hit_rate'] = (self.speculative_hits / self.speculative_requests
+                                         if self.speculative_requests else 0.0)
+        gate = self.gate.stats()
+        stats['gate_rejects'] = gate['rejects']
+        stats['gate_false_negatives'] = gate['false_negatives']
+        return stats
+
+    def clear_caches(self):
+        """清空画面、模板、门控和预读缓存，下一次查找一定会做OCR"""
+        self.change_detector.clear()
+        self.template_cache.invalidate()
+        self.gate.clear()
+        self._speculative.clear()
+
+    def reset(self):
+        """清空所有缓存和位置记录（切换画面或基准测试时使用）"""
+        self.clear_caches()
+        self.positions.clear()
+        if self.tracker is not None:
+            self.tracker.clear()
+
+    def set_frame_source(self, frame_source):
+        """切换画面来源（实时屏幕 / 回放 / 合成）"""
+        self.frame_source = frame_source
+
+    def set_clock(self, clock):
+        """位置记录的过期和门控的定时抽查使用的时钟，模拟运行时换成虚拟时钟"""
+        self.positions.clock = clock
+        self.gate.clock = clock
     
     def capture_screen(self):
         """捕获屏幕截图"""
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            if self.roi:
-                x, y, w, h = self.roi
-                screenshot = ImageGrab.grab(bbox=(x, y, x+w, y+h))
-            else:
-                screenshot = ImageGrab.grab()
-        return np.array(screenshot)
-    
-    def check_position(self, x, y, text, tolerance=10):
-        """检查位置是否稳定"""
-        # 如果是第一次检测到这个位置
-        if not hasattr(self, '_last_positions'):
-            self._last_positions = {}
-        
-        position_key = text
-        current_pos = (x, y)
-        current_time = time.time()
-        
-        if position_key not in self._last_positions:
-            self._last_positions[position_key] = {
-                'pos': current_pos,
-                'count': 1,
-                'last_time': current_time
-            }
-            print(f"首次检测位置 '{text}': ({x}, {y})")
-            return True  # 修改：首次检测就返回True
-        
-        last_record = self._last_positions[position_key]
-        last_pos = last_record['pos']
-        
-        # 检查坐标是否在允许的误差范围内
-        x_diff = abs(current_pos[0] - last_pos[0])
-        y_diff = abs(current_pos[1] - last_pos[1])
-        
-        print(f"位置检查: '{text}' 当前:({x}, {y}) 上次:({last_pos[0]}, {last_pos[1]})")
-        print(f"位置差异: X差异:{x_diff}像素, Y差异:{y_diff}像素 (允许误差:{tolerance}像素)")
-        
-        # 如果位置相近（考虑误差）
-        if x_diff <= tolerance and y_diff <= tolerance:
-            last_record['count'] += 1
-            print(f"位置稳定性: 连续检测次数 {last_record['count']}")
-            return True  # 修改：只要位置在误差范围内就返回True
+        return self.frame_source.grab(self.roi)
+
+    def _gray_buffer(self, shape):
+        """按线程和尺寸复用的灰度图缓冲区，下一次同尺寸的识别会覆盖其内容"""
+        key = (threading.get_ident(),) + tuple(shape)
+        buf = self._gray_buffers.get(key)
+        if buf is None:
+            buf = self._gray_buffers[key] = np.empty(shape, dtype=np.uint8)
+            while len(self._gray_buffers) > self.max_buffers:
+                self._gray_buffers.popitem(last=False)
         else:
-            # 位置发生较大变化，重置计数
-            print(f"位置不稳定，重置计数")
-            last_record['count'] = 1
-            last_record['pos'] = current_pos
-            last_record['last_time'] = current_time
-            return False
+            self._gray_buffers.move_to_end(key)
+        return buf
     
-    def find_text_location(self, target_text, roi=None):
+    def check_position(self, x, y, text, tolerance=None):
+        """检查位置是否稳定：首次出现或与上次位置相近时返回True"""
+        stable = self.positions.check(text, x, y, tolerance)
+        if not stable:
+            log.debug("位置不稳定，等待再次确认: '%s' (%s, %s)", text, x, y)
+        return stable
+
+    def snapshot(self, box):
+        """截取屏幕框 box 的灰度画面，用于点击前后对比"""
+        return cv2.cvtColor(self.frame_source.grab(box), cv2.COLOR_RGB2GRAY)
+
+    def frame_changed(self, box, before, pixel_threshold=24, min_fraction=0.01):
+        """box 的画面与点击前的 before 相比是否有明显变化
+
+        灰度差超过 pixel_threshold 的像素占比超过 min_fraction 即认为有变化，
+        区域很大而变化的只是一行文字时也能判断出来。
+        """
+        after = self.snapshot(box)
+        if after.shape != before.shape:
+            return True
+        diff = cv2.absdiff(after, before)
+        changed = cv2.countNonZero(cv2.threshold(diff, pixel_threshold, 255, cv2.THRESH_BINARY)[1])
+        return changed > before.size * min_fraction
+
+    def engine_for(self, settings):
+        """区域设置中指定了引擎时用进程内共用的该引擎，否则用识别器的默认引擎"""
+        if settings.engine in (None, 'auto', getattr(self.engine, 'name', None)):
+            return self.engine
+        return shared_engine(settings.engine)
+
+    def read_lines(self, screen, gray, settings=None):
+        """按区域设置预处理后做OCR，并按行合并文字块（坐标已映射回区域）"""
+        settings = settings or self._default_settings
+        with self.timings.span('preprocess'):
+            image = settings.pipeline(screen, gray)
+        with self.timings.span('ocr'):
+            if self.pool is not None:
+                # 多个客户端共用进程池，OCR在各自的工作进程里并行
+                data = self.pool.submit(image, settings.psm, settings.whitelist, settings.engine).result()
+            else:
+                data = self.engine_for(settings).image_to_data(image, settings.psm, settings.whitelist)
+        with self.timings.span('line_merge'):
+            return self.merge_lines(data, settings.pipeline.scale)
+
+    def merge_lines(self, data, scale=1):
+        """把OCR输出的文字块按行合并"""
+
+        # OCR原始输出，开启 verbose_ocr 时才记录
+        log.debug("OCR原始输出：%s", data['text'])
+        return self.group_lines(TokenTable.from_data(data, scale))
+
+    @staticmethod
+    def group_lines(table, line_threshold=20):
+        """按 (y, x) 排序后扫描一遍分行：与行首文字块的y差小于 line_threshold 的归入同一行
+
+        排序后只可能归入最后一行，不需要逐行比较。
+        """
+        texts, boxes = table.texts, table.boxes
+        xs, ys = boxes[0::4], boxes[1::4]
+        order = sorted(range(len(texts)), key=lambda i: (ys[i], xs[i]))
+        lines = []
+        start = 0
+        for k in range(1, len(order) + 1):
+            line_y = ys[order[start]]
+            if k < len(order) and ys[order[k]] - line_y < line_threshold:
+                continue
+            # 行内按x排序后拼接（排序稳定，x相同时保持y的顺序）
+            rows = sorted(order[start:k], key=xs.__getitem__) if k - start > 1 else order[start:k]
+            text = ''.join([texts[i] for i in rows])
+            lines.append({'y': line_y, 'text': text, 'chars': TextRecognizer._char_boxes(table, rows)})
+            log.debug("行内容: %s", text)
+            start = k
+        return lines
+
+    @staticmethod
+    def _char_boxes(table, rows):
+        """把每个字块的宽度平均分给其中的字符，得到行内每个字符的 (x, y, w, h)"""
+        boxes = []
+        coords = table.boxes
+        for row in rows:
+            text = table.texts[row]
+            b = 4 * row
+            x, y, w, h = coords[b], coords[b + 1], coords[b + 2], coords[b + 3]
+            n = len(text)
+            for i in range(n):
+                left = x + w * i // n
+                boxes.append((left, y, x + w * (i + 1) // n - left, h))
+        return boxes
+
+    def _matcher(self, targets):
+        """按目标组合和置信度下限缓存匹配器"""
+        key = (tuple(targets), self.fuzzy_threshold)
+        matcher = self._matchers.get(key)
+        if matcher is None:
+            matcher = self._matchers[key] = FuzzyMatcher(key[0], self.fuzzy_threshold)
+        return matcher
+
+    def find_many(self, targets, roi=None, region=None):
+        """一次OCR同时查找多个目标，返回 {目标文字: [(x, y), ...]}
+
+        region 为区域名（如 "area_boss"），用于选择该区域的预处理和tesseract参数；
+        开启跟踪时只OCR目标上次出现位置附近的小框，找不到再逐步放大到整个区域。
+        """
+        tracking = self.tracker is not None and region is not None and roi
+        if tracking:
+            roi = self.tracker.search_roi(region, targets, tuple(roi))
         if roi:
             self.set_roi(*roi)
         else:
-            self.set_roi(None)
+            self.roi = None
+        results = {target: [] for target in targets}
+        if not self.use_cache:
+            self.clear_caches()
+        with self.timings.span('capture'):
+            screen = self.capture_screen()
+            gray = cv2.cvtColor(screen, cv2.COLOR_RGB2GRAY, dst=self._gray_buffer(screen.shape[:2]))
+        screen_size = self.frame_source.screen_size()
+        roi_x, roi_y = self.roi[:2] if self.roi else (0, 0)
+
+        # 按钮区域先看像素特征，明显不像按钮时不做OCR
+        settings = self.region_settings.get(region)
+        gated = settings is not None and settings.gate and region is not None and self.roi
+        audit = False
+        if gated:
+            with self.timings.span('gate'):
+                plausible = self.gate.check(region, screen, (roi_x, roi_y))
+            if not plausible:
+                audit = self.gate.should_audit()
+                if not audit:
+                    log.debug("区域 %s 的像素特征与按钮不符，跳过OCR", region)
+                    return results
+        found_box = None
+
+        # 先尝试模板匹配，失败的目标再走一次完整OCR
+        pending = []
+        for target in targets:
+            point = None
+            if self.roi:
+                with self.timings.span('template'):
+                    point = self.template_cache.match(target, self.roi, gray, screen_size)
+            if point is not None:
+                center_x, center_y = roi_x + point[0], roi_y + point[1]
+                log.debug("模板匹配到目标 '%s'，中心点(%s, %s)", target, center_x, center_y)
+                if self.check_position(center_x, center_y, target):
+                    results[target].append((center_x, center_y))
+                    if found_box is None:
+                        # 模板命中没有文字框，沿用门控已记录的框
+                        box = self.gate.box(region)
+                        if box and box[0] <= center_x < box[0] + box[2] and box[1] <= center_y < box[1] + box[3]:
+                            found_box = box
+                    continue
+            pending.append(target)
+        if not pending:
+            if gated:
+                self._gate_found(region, screen, found_box, audit)
+            return results
+
+        # 区域画面没有变化时直接复用上一次的OCR结果
+        thumb = self.change_detector.fingerprint(gray)
+        lines = self.change_detector.lookup(self.roi, thumb)
+        if lines is None and self.roi:
+            lines = self._take_speculative(self.roi, thumb)
+            if lines is not None:
+                self.change_detector.store(self.roi, thumb, lines)
+        if lines is None:
+            lines = self.read_lines(screen, gray, settings)
+            self.change_detector.store(self.roi, thumb, lines)
+
+        # 所有行先统一做精确匹配，任何一行都没有精确命中的目标再取置信度最高的形近字容错结果
+        matcher = self._matcher(pending)
+        checked = set()
+        for index, start, end, target, score in matcher.search([line['text'] for line in lines]):
+            line = lines[index]
+            located = self._locate(line, start, end)
+            if located is None or not self.roi:
+                continue
+            (x, y), box = located
+            center_x, center_y = roi_x + x, roi_y + y
+            if score < 1:
+                log.debug("容错匹配到目标 '%s'（识别为 '%s'，置信度 %.2f），中心点(%s, %s)",
+                          target, line['text'][start:end], score, center_x, center_y)
+            else:
+                log.debug("找到目标 '%s'，中心点(%s, %s)", target, center_x, center_y)
+            if target not in checked:
+                # 只对每个目标的首个位置做稳定性检查和模板学习
+                checked.add(target)
+                self.template_cache.store(target, self.roi, gray, box, (x, y), screen_size)
+                screen_box = (roi_x + box[0], roi_y + box[1], box[2], box[3])
+                if tracking:
+                    self.tracker.hit(region, target, screen_box)
+                if found_box is None:
+                    found_box = screen_box
+                if not self.check_position(center_x, center_y, target):
+                    continue
+            elif not results[target]:
+                continue
+            results[target].append((center_x, center_y))
+        for target in pending:
+            if not results[target]:
+                log.debug("未找到目标文字 '%s'", target)
+                if tracking:
+                    self.tracker.miss(region, target)
+        if not any(results[target] for target in pending):
+            # 只缓存找到了目标的结果：指纹允许细微差别，缓存的未命中会在画面渐显、
+            # 识别偶尔失败时一直被复用到超时
+            self.change_detector.discard(self.roi)
+        if gated and any(results.values()):
+            self._gate_found(region, screen, found_box, audit)
+        return results
+
+    def _gate_found(self, region, screen, box, audit):
+        """找到了按钮：更新该区域的像素特征，抽查发现漏判时记一次并直接替换特征"""
+        if audit:
+            self.gate.false_negatives += 1
+            log.info("像素特征门控漏判: %s", region)
+        if box is not None:
+            self.gate.learn(region, screen, self.roi[:2], box, replace=audit)
+
+    def calibrate(self, targets, areas=None):
+        """校准：整屏OCR一次，为当前画面上出现的目标建立跟踪小框
+
+        targets 为 {区域名: [目标文字, ...]}，areas 为 {区域名: (x, y, width, height)}，
+        给出区域时只接受中心落在区域内的结果。返回 {区域名: {目标文字: [x, y, w, h]}}。
+        关闭了跟踪（tracker 为None）时只返回结果，不会重新开启跟踪。
+        """
+        areas = areas or {}
+        tracker = self.tracker if self.tracker is not None else BoxTracker()
+        self.roi = None
         screen = self.capture_screen()
-        gray = cv2.cvtColor(screen, cv2.COLOR_BGR2GRAY)
-        custom_config = r'--oem 3 --psm 6'
-        data = pytesseract.image_to_data(gray, lang='chi_sim', 
-                                        output_type=pytesseract.Output.DICT,
-                                        config=custom_config)
+        gray = cv2.cvtColor(screen, cv2.COLOR_RGB2GRAY)
+        # 整屏文字稀疏，用 psm 11 且不限制字符
+        lines = self.read_lines(screen, gray, RegionSettings({'psm': 11}))
+        texts_by_line = [line['text'] for line in lines]
+        result = {}
+        for region, texts in targets.items():
+            area = areas.get(region)
+            matcher = self._matcher(list(texts))
+            found = set()
+            for index, start, end, target, score in matcher.search(texts_by_line):
+                located = self._locate(lines[index], start, end)
+                if located is None or target in found:
+                    continue
+                (x, y), box = located
+                if area and not (area[0] <= x < area[0] + area[2] and area[1] <= y < area[1] + area[3]):
+                    continue
+                found.add(target)
+                tracker.hit(region, target, box)
+                log.info("校准: %s '%s' 位于 %s", region, target, box)
+            if found:
+                boxes = tracker.boxes()[region]
+                result[region] = {target: boxes[target] for target in found}
+        return result
 
-        # 新增：打印OCR原始输出
-        print("OCR原始输出：", data['text'])
+    def find_text_location(self, target_text, roi=None, region=None):
+        return self.find_many([target_text], roi, region)[target_text][:1]
 
-        # 收集所有文字及其位置
-        text_blocks = []
-        for i, text in enumerate(data['text']):
-            if text.strip():
-                x = data['left'][i]
-                y = data['top'][i]
-                w = data['width'][i]
-                h = data['height'][i]
-                conf = float(data['conf'][i])
-                text_blocks.append((text, x, y, w, h, conf))
-
-        # 横向合并：按y坐标分组（同一行），每行内按x排序
-        lines = []
-        line_threshold = 20  # 行高容忍像素
-        text_blocks.sort(key=lambda x: (x[2], x[1]))  # 先按y再按x排序
-
-        for block in text_blocks:
-            text, x, y, w, h, conf = block
-            # 尝试归入已有行
-            found_line = False
-            for line in lines:
-                if abs(line['y'] - y) < line_threshold:
-                    line['blocks'].append(block)
-                    found_line = True
-                    break
-            if not found_line:
-                lines.append({'y': y, 'blocks': [block]})
-
-        # 在每一行内横向拼接字符串，并查找目标
-        for line in lines:
-            blocks = sorted(line['blocks'], key=lambda b: b[1])  # 按x排序
-            line_text = ''.join([b[0] for b in blocks])
-            print(f"行内容: {line_text}")
-            idx = line_text.find(target_text)
-            if idx != -1:
-                # 找到目标字符串，定位起始字块
-                char_count = 0
-                for b in blocks:
-                    if char_count == idx:
-                        x, y, w, h, conf = b[1:6]
-                        if self.roi:
-                            roi_x, roi_y, _, _ = self.roi
-                            global_x = roi_x + x
-                            global_y = roi_y + y
-                            center_x = global_x + w // 2
-                            center_y = global_y + h // 2
-                            print(f"找到目标 '{target_text}'，中心点({center_x}, {center_y})")
-                            if self.check_position(center_x, center_y, target_text):
-                                return [(center_x, center_y)]
-                        break
-                    char_count += len(b[0])
-        print(f"未找到目标文字 '{target_text}'")
-        return []
+    @staticmethod
+    def _locate(line, start, end):
+        """根据行内字符下标 [start, end) 定位目标，返回 (区域内中心点, 目标外接矩形)
+
+        按字符坐标计算，目标只占字块的一部分时也能点到目标本身而不是整个字块的中心。
+        """
+        boxes = line['chars'][start:end]
+        if not boxes:
+            return None
+        x0 = min(b[0] for b in boxes)
+        y0 = min(b[1] for b in boxes)
+        x1 = max(b[0] + b[2] for b in boxes)
+        y1 = max(b[1] + b[3] for b in boxes)
+        return ((x0 + x1) // 2, (y0 + y1) // 2), (x0, y0, x1 - x0, y1 - y0)
 
 # 创建全局识别器实例
 recognizer = TextRecognizer()
+recognizer.configure_regions()
 
 def set_recognition_area(x, y, width, height):
     """设置识别区域"""
     recognizer.set_roi(x, y, width, height)
 
-def click_on_text(target_text, roi=None):
-    """识别并点击指定文字"""
-    locations = recognizer.find_text_location(target_text, roi)
-    
-    if locations:
-        x, y = locations[0]
-        print(f"找到文字 '{target_text}' 在位置 ({x}, {y})，正在点击...")
-        pyautogui.click(x, y)
-        return True, f"找到文字 '{target_text}' 在位置 ({x}, {y})，已点击"
-    else:
-        return False, f"未找到文字 '{target_text}'"
+def set_frame_source(frame_source):
+    """设置画面来源"""
+    recognizer.set_frame_source(frame_source)
+
+def configure_regions(settings=None, targets=None):
+    """设置各区域的预处理和tesseract参数"""
+    recognizer.configure_regions(settings, targets)
+
+def set_ocr_pool(pool):
+    """设置OCR进程池"""
+    recognizer.set_pool(pool)
+
+def speculate(regions):
+    """预先OCR多个区域"""
+    recognizer.speculate(regions)
+
+def calibrate(targets, areas=None):
+    """整屏OCR一次，为各区域的目标建立跟踪小框"""
+    return recognizer.calibrate(targets, areas)
+
+def get_timings():
+    """返回识别器的分阶段计时器"""
+    return recognizer.timings
+
+def get_cache_stats():
+    """返回OCR缓存命中统计"""
+    return recognizer.cache_stats()
 
+def click_on_text(target_text, roi=None, region=None, text_recognizer=None, input_backend=None,
+                  also_find=(), results=None, verify=False):
+    """识别并点击指定文字，target_text为列表时一次OCR查找全部候选，按顺序点击第一个找到的
 
+    text_recognizer / input_backend 默认使用全局识别器和pyautogui，多客户端时各自传入。
+    also_find 中的文字在同一次OCR中一起查找但不会点击，传入 results 字典时写入所有查找结果。
+    verify 为True时点击前截取目标所在区域，记入 text_recognizer.last_click，之后可用
+    frame_changed 确认点击是否生效。
+    """
+    text_recognizer = text_recognizer or recognizer
+    input_backend = input_backend or default_input
+    targets = [target_text] if isinstance(target_text, str) else list(target_text)
+    found = text_recognizer.find_many(targets + [t for t in also_find if t not in targets], roi, region)
+    if results is not None:
+        results.update(found)
+    for target in targets:
+        if found[target]:
+            x, y = found[target][0]
+            log.debug("找到文字 '%s' 在位置 (%s, %s)，正在点击...", target, x, y)
+            if verify and text_recognizer.roi:
+                box = text_recognizer.roi
+                text_recognizer.last_click = {'target': target, 'point': (x, y), 'roi': box,
+                                              'before': text_recognizer.snapshot(box)}
+            with text_recognizer.timings.span('click'):
+                input_backend.click(x, y)
+            # 点击前截取的画面已经过时
+            text_recognizer.frame_source.invalidate()
+            return True, f"找到文字 '{target}' 在位置 ({x}, {y})，已点击"
+    return False, f"未找到文字 '{'/'.join(targets)}'"
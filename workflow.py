@@ -0,0 +1,416 @@
+import threading
+
+import text_recognition
+from text_recognition import TextRecognizer, click_on_text
+from frame_source import create_frame_source
+from input_backend import default_input
+from metrics import RunStats
+from clock import real_clock
+from boss_layout import BossLayout
+from app_log import get_logger
+from app_config import (AREA_KEYS, BOSS_NAMES, CHANGE_REWARD_LABELS, CONFIG_FILE, OPEN_LABELS, boss_text,
+                        profiles, region_targets, save_profile_setting)
+
+
+def create_pool(config, pool=None):
+    """按 ocr_workers 创建OCR进程池，已有进程池时直接复用，为0时不使用"""
+    workers = config.get("ocr_workers", 3)
+    if not workers:
+        return None
+    if pool is None:
+        from ocr_pool import OCRWorkerPool
+        pool = OCRWorkerPool(workers)
+    return pool
+
+
+def create_recognizer(config, pool=None):
+    """为一个客户端创建独立的识别器，OCR引擎在进程内共用，需要时才创建"""
+    frame_source = None
+    if config.get("frame_source"):
+        # 例如 {"type": "replay", "path": "recordings"}，可在无游戏画面时回放录制的截图
+        frame_source = create_frame_source(config["frame_source"])
+    recognizer = TextRecognizer(frame_source=frame_source)
+    recognizer.configure_regions(config.get("region_settings"), region_targets(config))
+    if "fuzzy_threshold" in config:
+        recognizer.fuzzy_threshold = config["fuzzy_threshold"]
+    if config.get("roi_tracking", True):
+        # 校准或上次运行得到的文字小框
+        recognizer.tracker.seed(config.get("tracked_boxes"))
+    else:
+        recognizer.tracker = None
+    recognizer.set_pool(pool)
+    return recognizer
+
+
+def build_workflows(config, pool=None, names=None, **kwargs):
+    """为配置中的每个客户端创建流程，names 不为空时只创建指定名称的客户端"""
+    selected = [p for p in profiles(config) if not names or p["name"] in names]
+    return [
+        RewardWorkflow.from_config(
+            profile, recognizer=create_recognizer(profile, pool),
+            name=profile["name"] if len(selected) > 1 else None, **kwargs)
+        for profile in selected
+    ]
+
+
+def save_boss_layouts(workflows, path=CONFIG_FILE):
+    """把运行中更新过的boss列表布局写回配置文件，返回写入的个数"""
+    count = 0
+    for workflow in workflows:
+        if workflow.boss_layout is not None and workflow.boss_layout.changed:
+            save_profile_setting("boss_layout", workflow.boss_layout.to_config(), workflow.profile, path)
+            workflow.boss_layout.changed = False
+            count += 1
+    return count
+
+
+class RewardWorkflow:
+    """更改奖励 → 选择boss → 下滑重试 → 打开 的状态机
+
+    每次 step() 只做一次探测，返回距离下一次探测的等待秒数，流程结束时返回 None。
+    等待都通过 stop_event 完成，调用 stop() 后立即生效。
+    """
+    CHANGE_REWARD = "change_reward"
+    SELECT_BOSS = "select_boss"
+    SCROLL_RETRY = "scroll_retry"
+    OPEN = "open"
+
+    def __init__(self, boss_text, interval, down_coordinate, area_change_reward, area_boss, area_open,
+                 log=None, poll_min=0.1, poll_max=1.0, boss_timeout=2.0, scroll_timeout=1.0,
+                 open_timeout=3.0, max_scrolls=3, change_reward_labels=CHANGE_REWARD_LABELS, open_labels=OPEN_LABELS,
+                 metrics_file=None, max_cycles=None, recognizer=None, input_backend=None, name=None, clock=None,
+                 boss_names=BOSS_NAMES, boss_layout=None, verify_clicks=True, click_retry_after=1.0,
+                 max_click_retries=2, speculate_delay=0.5):
+        self.name = name
+        # 配置中的客户端名称，写回配置时使用
+        self.profile = None
+        # 所有等待和超时都经过时钟，模拟运行时换成虚拟时钟
+        self.clock = clock or real_clock
+        self.boss_text = boss_text
+        self.interval = interval
+        self.down_coordinate = down_coordinate
+        self.area_change_reward = area_change_reward
+        self.area_boss = area_boss
+        self.area_open = area_open
+        log = log or get_logger().info
+        # 多客户端时在日志前加上客户端名称
+        self.log = (lambda msg: log(f"[{name}] {msg}")) if name else log
+        self.recognizer = recognizer or text_recognition.recognizer
+        self.input = input_backend or default_input
+        self.poll_min = poll_min
+        self.poll_max = poll_max
+        self.boss_timeout = boss_timeout
+        self.scroll_timeout = scroll_timeout
+        self.open_timeout = open_timeout
+        self.max_scrolls = max_scrolls
+        # 按钮的候选文字，多个候选只做一次OCR
+        self.change_reward_labels = list(change_reward_labels)
+        self.open_labels = list(open_labels)
+        # boss列表布局，记录后可以直接下滑到目标所在页，为None时每轮都完整查找
+        self.boss_names = [name for name in boss_names if name != boss_text]
+        self.boss_layout = boss_layout
+        # 点击后对比目标区域的画面确认点击生效，画面超过 click_retry_after 秒没有变化时重新点击
+        self.verify_clicks = verify_clicks
+        self.click_retry_after = click_retry_after
+        self.max_click_retries = max_click_retries
+        self._click = None
+        # 点击"打开"后要等到该时刻才识别下一轮的"更改奖励"，等待期间照常确认点击
+        self._resume_at = None
+        # 点击后要预读的区域，确认界面已切换（或不确认时等待 speculate_delay 秒）后才提交
+        self.speculate_delay = speculate_delay
+        self._speculation = None
+        # 完成指定轮数后自动停止，None表示不限
+        self.max_cycles = max_cycles
+        self.stop_event = threading.Event()
+        self.state = self.CHANGE_REWARD
+        self.scrolls = 0
+        self.cycles = 0
+        self._deadline = None
+        self._timeout = None
+        self._poll = poll_min
+        self._cycle_start = None
+        # 与识别器共用计时器，所有阶段耗时汇总在一起
+        self.stats = RunStats(self.recognizer.timings, metrics_file, clock=self.clock)
+
+    @property
+    def running(self):
+        return not self.stop_event.is_set()
+
+    def stop(self):
+        self.stop_event.set()
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        """由 config.json 的内容创建流程"""
+        areas = [tuple(config[key]) if config.get(key) else None for key in AREA_KEYS]
+        down = config.get("down_coordinate")
+        options = dict(config.get("button_labels") or {})
+        options["metrics_file"] = config.get("metrics_file")
+        # boss_layout 设为 false 时不记录布局
+        if config.get("boss_layout") is not False:
+            options["boss_layout"] = BossLayout(areas[1], down, config.get("boss_layout"))
+        if "verify_clicks" in config:
+            options["verify_clicks"] = config["verify_clicks"]
+        options.update(kwargs)
+        workflow = cls(boss_text(config), config.get("interval", 15), tuple(down) if down else None,
+                       *areas, **options)
+        workflow.profile = config.get("name")
+        return workflow
+
+    def _enter(self, state, timeout=None):
+        """切换状态，timeout为等待目标出现的最长时间"""
+        self.state = state
+        self._timeout = timeout
+        self._deadline = self.clock.now() + timeout if timeout is not None else None
+        self._poll = self.poll_min
+        return self.poll_min
+
+    def _backoff(self, limit):
+        """未出现目标时逐渐拉长探测间隔"""
+        delay = self._poll
+        self._poll = min(self._poll * 2, limit)
+        return delay
+
+    def _speculate(self, *names):
+        """记下下一步要预读的区域
+
+        点击后画面还没切换，这时预读的结果必然与之后的画面对不上，所以等界面切换后再提交。
+        """
+        if self.recognizer.pool is not None:
+            self._speculation = (names, self.clock.now())
+
+    def next_read(self):
+        """下一次 step() 要OCR的 (区域名, 区域, 目标文字)，不会识别时返回None
+
+        调度器用它把同时到期的多个客户端要识别的区域拼在一起预读。
+        """
+        if self._click is not None or (self._resume_at is not None and self._resume_at > self.clock.now()):
+            return None
+        if self.state == self.CHANGE_REWARD:
+            return "area_change_reward", self.area_change_reward, self.change_reward_labels
+        if self.state == self.SELECT_BOSS:
+            if self.boss_layout is None:
+                return "area_boss", self.area_boss, [self.boss_text]
+            if self.boss_layout.get(self.boss_text) is None:
+                return "area_boss", self.area_boss, [self.boss_text] + self.boss_names
+        if self.state == self.OPEN:
+            return "area_open", self.area_open, self.open_labels
+        return None
+
+    def _flush_speculation(self):
+        """把记下的区域提交给OCR进程池预读"""
+        names = self._speculation[0]
+        self._speculation = None
+        self.recognizer.speculate({name: getattr(self, name) for name in names})
+
+    def calibrate(self, targets=None):
+        """整屏OCR一次，为各区域的目标建立跟踪小框，返回找到的小框
+
+        targets 默认为本流程要点击的按钮文字和boss。配置了 roi_tracking: false 时跳过校准。
+        """
+        if self.recognizer.tracker is None:
+            self.log("已关闭ROI跟踪（roi_tracking: false），跳过校准")
+            return {}
+        targets = targets or {
+            "area_change_reward": self.change_reward_labels,
+            "area_boss": [self.boss_text],
+            "area_open": self.open_labels,
+        }
+        boxes = self.recognizer.calibrate(targets, {key: getattr(self, key) for key in AREA_KEYS})
+        count = sum(len(found) for found in boxes.values())
+        self.log(f"校准完成，找到{count}个目标" if count else "校准未找到任何目标，将搜索完整区域")
+        return boxes
+
+    def _timed_out(self):
+        return self._deadline is not None and self.clock.now() >= self._deadline
+
+    def _click_on_text(self, target_text, region, roi=None, **kwargs):
+        self.recognizer.last_click = None
+        result = click_on_text(target_text, roi or getattr(self, region), region, self.recognizer, self.input,
+                               verify=self.verify_clicks, **kwargs)
+        if result[0] and self.recognizer.last_click is not None:
+            self._click = dict(self.recognizer.last_click, time=self.clock.now(), retries=0)
+        return result
+
+    def _check_click(self):
+        """确认上一次点击已生效
+
+        画面有变化时返回None，照常识别下一步；画面没变化说明界面还没切换，
+        下一步的目标不可能出现，每隔 poll_min 秒对比一次而不做OCR。超过 click_retry_after 秒仍没有变化时
+        按预测的点击点重新点击，重试次数用完后放弃确认，回到正常识别。
+        确认期间不计入当前状态的超时，结束后重新进入当前状态，探测间隔和超时从头开始。
+        """
+        click = self._click
+        if self.recognizer.frame_changed(click['roi'], click['before']):
+            self._click = None
+            if self._speculation is not None:
+                self._flush_speculation()
+            self._enter(self.state, self._timeout)
+            return None
+        if self.clock.now() - click['time'] < self.click_retry_after:
+            return self.poll_min
+        if click['retries'] >= click.get('max_retries', self.max_click_retries):
+            self._click = None
+            self._enter(self.state, self._timeout)
+            return None
+        x, y = self.recognizer.positions.predict(click['target']) or click['point']
+        with self.stats.timings.span('click'):
+            self.input.click(x, y)
+        self.recognizer.frame_source.invalidate()
+        click['retries'] += 1
+        click['time'] = self.clock.now()
+        self.stats.click_retries += 1
+        self.log(f"点击'{click['target']}'后画面没有变化，重新点击 ({x}, {y})")
+        return self.poll_min
+
+    def _scroll(self):
+        """点击下滑；翻页完成前上一页仍在画面上，确认boss区域变化后才继续识别"""
+        before = None
+        if self.verify_clicks and self.area_boss:
+            before = self.recognizer.snapshot(tuple(self.area_boss))
+        with self.stats.timings.span('click'):
+            self.input.click(self.down_coordinate[0], self.down_coordinate[1])
+        self.recognizer.frame_source.invalidate()
+        self.scrolls += 1
+        if before is not None:
+            # 画面一直不变多半是已到最后一页，不重新点击；点击丢失时下一次下滑重试会再点
+            self._click = {'target': "下滑", 'point': tuple(self.down_coordinate), 'roi': tuple(self.area_boss),
+                           'before': before, 'time': self.clock.now(), 'retries': 0, 'max_retries': 0}
+
+    def _select_boss_by_layout(self, row):
+        """按记录的布局直接下滑到目标所在页，每页只OCR一行来确认"""
+        if self.scrolls < row[0]:
+            # 确认当前页已经显示后再下滑
+            probe = self.boss_layout.probe(self.scrolls)
+            if probe is None or not self.down_coordinate:
+                return self._layout_mismatch()
+            if self.recognizer.find_many([probe], self.boss_layout.strip(probe), "area_boss")[probe]:
+                self._scroll()
+                self.log(f"按记录的布局下滑（第{self.scrolls}次）")
+                return self._enter(self.SELECT_BOSS, self.scroll_timeout)
+        else:
+            found, msg = self._click_on_text(self.boss_text, "area_boss", self.boss_layout.strip(self.boss_text))
+            self.log(msg)
+            if found:
+                self._speculate("area_open")
+                return self._enter(self.OPEN, self.open_timeout)
+        if not self._timed_out():
+            return self._backoff(self.poll_max)
+        return self._layout_mismatch()
+
+    def _layout_mismatch(self):
+        """布局对不上：清空记录，本轮从当前页开始完整查找并重新记录"""
+        self.log("boss列表与记录的布局不一致，重新记录")
+        self.boss_layout.clear()
+        return self._enter(self.SELECT_BOSS, self.boss_timeout)
+
+    def step(self):
+        if self._click is not None:
+            delay = self._check_click()
+            if delay is not None:
+                return delay
+        elif self._speculation is not None and self.clock.now() - self._speculation[1] >= self.speculate_delay:
+            # 没有确认点击（下滑或关闭了确认）时按延迟估计界面已切换
+            self._flush_speculation()
+        if self._resume_at is not None:
+            remaining = self._resume_at - self.clock.now()
+            if remaining > 0:
+                return remaining
+            self._resume_at = None
+
+        if self.state == self.CHANGE_REWARD:
+            # 1. 识别"更改奖励"
+            found, msg = self._click_on_text(self.change_reward_labels, "area_change_reward")
+            self.log(msg)
+            if not found:
+                return self._backoff(self.interval)
+            self.scrolls = 0
+            self.stats.cycles_started += 1
+            self._cycle_start = self.clock.now()
+            if self.boss_layout is None or self.boss_layout.get(self.boss_text) is None:
+                # 按布局查找时只OCR目标所在的一行，不预读整个boss区域
+                self._speculate("area_boss")
+            return self._enter(self.SELECT_BOSS, self.boss_timeout)
+
+        if self.state == self.SELECT_BOSS:
+            row = self.boss_layout.get(self.boss_text) if self.boss_layout is not None else None
+            if row is not None:
+                return self._select_boss_by_layout(row)
+            # 2. 等待boss列表出现并识别boss，同一次OCR记下当前页其它boss的位置
+            seen = {}
+            found, msg = self._click_on_text(self.boss_text, "area_boss", results=seen,
+                                             also_find=self.boss_names if self.boss_layout is not None else ())
+            self.log(msg)
+            if self.boss_layout is not None:
+                for name, points in seen.items():
+                    if points:
+                        self.boss_layout.record(name, self.scrolls, *points[0])
+            if found:
+                self._speculate("area_open")
+                return self._enter(self.OPEN, self.open_timeout)
+            if not self._timed_out():
+                return self._backoff(self.poll_max)
+            self.stats.timeouts += 1
+            return self._enter(self.SCROLL_RETRY)
+
+        if self.state == self.SCROLL_RETRY:
+            if not self.down_coordinate:
+                self.log("未设置下滑坐标，无法下滑")
+                self.log("多次未识别到boss，停止识别")
+                return None
+            if self.scrolls >= self.max_scrolls:
+                self.log("多次未识别到boss，停止识别")
+                return None
+            self._scroll()
+            self.stats.retries += 1
+            self.log("未识别到boss，点击下滑重试")
+            self._speculate("area_boss")
+            return self._enter(self.SELECT_BOSS, self.scroll_timeout)
+
+        if self.state == self.OPEN:
+            # 3. 等待并识别"打开"
+            found, msg = self._click_on_text(self.open_labels, "area_open")
+            self.log(msg)
+            if found:
+                self.cycles += 1
+                self.stats.cycles_completed += 1
+                self.stats.timings.record('cycle', self.clock.now() - self._cycle_start)
+                self.stats.maybe_write()
+                if self.max_cycles and self.cycles >= self.max_cycles:
+                    self.stop()
+                # 间隔结束后才识别"更改奖励"，不预读；点击需要确认时先每隔 poll_min 秒对比画面
+                self._enter(self.CHANGE_REWARD)
+                self._resume_at = self.clock.now() + self.interval
+                return self.poll_min if self._click is not None else self.interval
+            if not self._timed_out():
+                return self._backoff(self.poll_max)
+            self.stats.timeouts += 1
+            self.log("未识别到'打开'，停止识别")
+            return None
+
+        raise ValueError(f"未知状态: {self.state}")
+
+    def run(self):
+        """循环执行直到流程结束或被停止"""
+        while self.running:
+            delay = self.step()
+            if delay is None:
+                break
+            self.stats.timings.record('sleep', delay)
+            if self.clock.wait(self.stop_event, delay):
+                break
+        try:
+            self.finish()
+        finally:
+            self.close()
+
+    def finish(self):
+        """流程结束时写指标文件并输出缓存统计"""
+        self.stats.maybe_write(force=True)
+        stats = self.recognizer.cache_stats()
+        self.log(f"OCR缓存: 命中{stats['hits']}次，未命中{stats['misses']}次，节省{stats['hit_rate']:.0%}的OCR，"
+                 f"预读命中{stats['speculative_hits']}/{stats['speculative_requests']}次")
+
+    def close(self):
+        """释放识别器的画面来源（后台截图线程、回放的视频文件等）"""
+        self.recognizer.frame_source.close()